@@ -0,0 +1,245 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+
+from metrics import ADMISSION_DECISIONS
+
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+ADMISSION_MAX_KEYS = int(os.getenv("ADMISSION_MAX_KEYS", 100000))
+# За обратным прокси адрес клиента берётся из последнего элемента X-Forwarded-For.
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "0") == "1"
+
+# Значения по умолчанию для эндпоинтов; каждое переопределяется переменной
+# ADMISSION_<ЭНДПОИНТ>_<ПАРАМЕТР>, например ADMISSION_SUBMIT_USER_RATE.
+# Скорости — запросов в минуту (0 — без ограничения), max_concurrent —
+# одновременных запросов (0 — без ограничения), max_waiting — мест в очереди
+# ожидания, wait_timeout — секунд ожидания в ней.
+DEFAULT_POLICIES = {
+    # Одновременные проверки решений ограничены очередью проверок
+    # (EVAL_WORKERS, EVAL_QUEUE_SIZE), поэтому здесь только лимиты частоты.
+    "submit": {
+        "user_rate": 10,
+        "user_burst": 5,
+        "ip_rate": 120,
+        "ip_burst": 60,
+    },
+    "generate-task": {
+        "user_rate": 2,
+        "user_burst": 3,
+        "ip_rate": 20,
+        "ip_burst": 10,
+        "max_concurrent": 4,
+        "max_waiting": 16,
+        "wait_timeout": 10,
+    },
+}
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонён контролем нагрузки."""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_response(self) -> web.Response:
+        error = (
+            "Слишком много запросов, попробуйте позже"
+            if self.status == 429
+            else "Сервер перегружен, попробуйте позже"
+        )
+        return web.json_response(
+            {"ok": False, "error": error},
+            status=self.status,
+            headers={"Retry-After": str(max(1, math.ceil(self.retry_after)))},
+        )
+
+
+class TokenBuckets:
+    """
+    Token bucket на каждый ключ: rate токенов в минуту, не больше burst.
+    Хранит не больше max_keys ключей; вытесненный ключ начинает с полного бакета.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, max_keys: int = ADMISSION_MAX_KEYS):
+        self.rate = rate_per_minute / 60
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Any, Tuple[float, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, key) -> float:
+        """Списывает токен. Возвращает 0 или сколько секунд ждать следующего."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class EndpointAdmission:
+    """
+    Контроль нагрузки одного эндпоинта: лимиты частоты по IP и по
+    пользователю (429) и глобальное ограничение одновременных запросов с
+    ограниченной очередью ожидания (503, когда очередь полна или ожидание
+    превысило wait_timeout).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        user_rate: float,
+        user_burst: float,
+        ip_rate: float,
+        ip_burst: float,
+        max_concurrent: float = 0,
+        max_waiting: float = 0,
+        wait_timeout: float = 0,
+    ):
+        self.name = name
+        self.users = TokenBuckets(user_rate, user_burst)
+        self.ips = TokenBuckets(ip_rate, ip_burst)
+        self.max_concurrent = int(max_concurrent)
+        self.max_waiting = int(max_waiting)
+        self.wait_timeout = wait_timeout
+        self._semaphore = (
+            asyncio.Semaphore(self.max_concurrent) if self.max_concurrent > 0 else None
+        )
+        self.active = 0
+        self.waiting = 0
+        self.counters = {
+            "accepted": 0,
+            "shed_ip": 0,
+            "shed_user": 0,
+            "shed_queue_full": 0,
+            "shed_wait_timeout": 0,
+        }
+
+    def record(self, outcome: str):
+        self.counters[outcome] = self.counters.get(outcome, 0) + 1
+        ADMISSION_DECISIONS.labels(self.name, outcome).inc()
+
+    async def _take(self, buckets: TokenBuckets, kind: str, key) -> float:
+        if shared_take is not None and buckets.enabled:
+            return await shared_take(
+                f"{self.name}:{kind}:{key}", buckets.rate * 60, buckets.burst
+            )
+        return buckets.take(key)
+
+    async def check_ip(self, request: web.Request):
+        """Лимит по адресу клиента; проверяется до разбора тела и авторизации."""
+        if not ADMISSION_ENABLED:
+            return
+        retry_after = await self._take(self.ips, "ip", client_ip(request))
+        if retry_after:
+            self.record("shed_ip")
+            raise AdmissionRejected(429, "ip_rate", retry_after)
+
+    async def check_user(self, user_id: int):
+        if not ADMISSION_ENABLED:
+            return
+        retry_after = await self._take(self.users, "user", user_id)
+        if retry_after:
+            self.record("shed_user")
+            raise AdmissionRejected(429, "user_rate", retry_after)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Место среди одновременно выполняемых запросов эндпоинта."""
+        if not ADMISSION_ENABLED or self._semaphore is None:
+            self.record("accepted")
+            yield
+            return
+
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.record("shed_queue_full")
+                raise AdmissionRejected(503, "queue_full", self.wait_timeout or 1)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.record("shed_wait_timeout")
+                raise AdmissionRejected(503, "wait_timeout", self.wait_timeout)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.record("accepted")
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+        }
+
+
+# Общие для воркеров лимиты частоты: take(ключ, запросов в минуту, burst) ->
+# секунд до следующего запроса. Задаётся use_shared_buckets; ограничение
+# одновременности остаётся в пределах процесса.
+shared_take: Optional[Callable[[str, float, float], Awaitable[float]]] = None
+
+
+def use_shared_buckets(take: Callable[[str, float, float], Awaitable[float]]):
+    global shared_take
+    shared_take = take
+
+
+def client_ip(request: web.Request) -> str:
+    if ADMISSION_TRUST_FORWARDED:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.remote or "unknown"
+
+
+def policy_from_env(name: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    prefix = "ADMISSION_" + name.upper().replace("-", "_") + "_"
+    return {
+        key: float(os.getenv(prefix + key.upper(), value))
+        for key, value in defaults.items()
+    }
+
+
+endpoints: Dict[str, EndpointAdmission] = {
+    name: EndpointAdmission(name, **policy_from_env(name, defaults))
+    for name, defaults in DEFAULT_POLICIES.items()
+}
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "endpoints": {name: endpoint.stats() for name, endpoint in endpoints.items()},
+    }
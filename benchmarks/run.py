@@ -0,0 +1,499 @@
+"""
+Нагрузочный бенчмарк HTTP-эндпоинтов бота без внешних сервисов.
+
+Поднимает приложение из bot.py на локальной БД, подменяет Hugging Face API,
+LLM и Telegram Bot API заглушками (benchmarks/stubs.py) с настраиваемой
+задержкой и гоняет сценарии с заданной конкуррентностью. Результаты
+(пропускная способность, p50/p95/p99) печатаются и сохраняются в JSON.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run --concurrency 32 --requests 2000
+    python -m benchmarks.run --database-url postgresql+asyncpg://bench@localhost/bench
+    python -m benchmarks.run --scenarios tasks,submit --compare benchmarks/results/base.json
+
+Зависимости бенчмарка ставятся группой bench: poetry install --with bench.
+
+По умолчанию используется временная SQLite-база (aiosqlite). Запросы к
+PostgreSQL в ней идут по запасным путям, поэтому цифры для продакшена
+стоит снимать на PostgreSQL. Генератор нагрузки, приложение и заглушки
+работают в одном процессе и делят один цикл событий.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.stubs import REFERENCE_SOLUTION, REFERENCE_TESTS, StubServer
+
+
+SCENARIOS = (
+    "tasks",
+    "getUser",
+    "history",
+    "submit",
+    "submit-stream",
+    "generate-task",
+    "webhook",
+)
+BENCH_BOT_TOKEN = "123456789:BENCHMARK-bench-token-0000000000000"
+BENCH_USER_BASE = 9_000_000_000
+SUBMIT_POLL_INTERVAL = 0.02
+
+
+def sign_init_data(bot_token: str, user_id: int, username: str) -> str:
+    """Подписанный initData мини-приложения, как его формирует Telegram."""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"bench-{user_id}",
+        "user": json.dumps(
+            {"id": user_id, "first_name": username, "username": username},
+            separators=(",", ":"),
+        ),
+    }
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(
+        secret_key, data_check_string.encode(), hashlib.sha256
+    ).hexdigest()
+    return urlencode(fields)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(
+    name: str, latencies: List[float], statuses: Dict[str, int], elapsed: float
+) -> Dict[str, Any]:
+    values = sorted(latency * 1000 for latency in latencies)
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "scenario": name,
+        "requests": len(values),
+        "errors": errors,
+        "statuses": statuses,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "min": round(values[0], 2) if values else None,
+            "mean": round(sum(values) / len(values), 2) if values else None,
+            "p50": round(percentile(values, 0.5), 2) if values else None,
+            "p95": round(percentile(values, 0.95), 2) if values else None,
+            "p99": round(percentile(values, 0.99), 2) if values else None,
+            "max": round(values[-1], 2) if values else None,
+        },
+    }
+
+
+async def drive(
+    name: str,
+    requests: int,
+    concurrency: int,
+    make_request: Callable[[int], Awaitable[int]],
+    first_index: int = 0,
+) -> Dict[str, Any]:
+    """Закрытая модель нагрузки: concurrency клиентов выполняют requests запросов."""
+    counter = iter(range(first_index, first_index + requests))
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def client():
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                status = str(await make_request(index))
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(name, latencies, statuses, time.perf_counter() - started)
+
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace, bot_module, base_url: str):
+        self.args = args
+        self.bot = bot_module
+        self.base_url = base_url
+        self.users = [BENCH_USER_BASE + index for index in range(args.users)]
+        self.init_data = {
+            user_id: sign_init_data(BENCH_BOT_TOKEN, user_id, f"bench{user_id}")
+            for user_id in self.users
+        }
+        self.task_ids: List[int] = []
+        # Номера обновлений уникальны в пределах запуска и между запусками.
+        self.update_base = int(time.time()) * 1_000_000
+        self.http: aiohttp.ClientSession = None
+
+    async def seed(self):
+        bot = self.bot
+        async with bot.async_session() as session:
+            for user_id in self.users:
+                if await session.get(bot.User, user_id) is None:
+                    session.add(
+                        bot.User(id=user_id, username=f"bench{user_id}", points=0)
+                    )
+            tasks = [
+                bot.Task(
+                    title=f"Бенчмарк {index}",
+                    description="Отсортируйте список по возрастанию.",
+                    difficulty=("Легко", "Средне", "Сложно")[index % 3],
+                    points=5,
+                    inference=REFERENCE_SOLUTION,
+                    entry_point="solution",
+                    test_cases=REFERENCE_TESTS if self.args.tests else None,
+                )
+                for index in range(self.args.tasks)
+            ]
+            session.add_all(tasks)
+            await session.commit()
+            self.task_ids = [task.id for task in tasks]
+        bot.task_catalog.invalidate()
+        await bot.rebuild_leaderboard()
+
+    async def tasks(self, index: int) -> int:
+        async with self.http.get(f"{self.base_url}/api/tasks") as response:
+            await response.read()
+            return response.status
+
+    async def get_user(self, index: int) -> int:
+        user_id = self.users[index % len(self.users)]
+        async with self.http.post(
+            f"{self.base_url}/api/getUser", json={"initData": self.init_data[user_id]}
+        ) as response:
+            await response.read()
+            return response.status
+
+    async def history(self, index: int) -> int:
+        user_id = self.users[index % len(self.users)]
+        async with self.http.get(
+            f"{self.base_url}/api/history",
+            headers={"Authorization": f"Bearer {self.bot.issue_token(user_id)}"},
+        ) as response:
+            await response.read()
+            return response.status
+
+    def submission(self, index: int) -> Dict[str, Any]:
+        user_id = self.users[index % len(self.users)]
+        task_id = self.task_ids[(index // len(self.users)) % len(self.task_ids)]
+        code = REFERENCE_SOLUTION.replace("result", "items")
+        if not self.args.cache_hits:
+            code += f"\n# submission {index}\n"
+        return {"initData": self.init_data[user_id], "taskId": task_id, "code": code}
+
+    async def submit(self, index: int) -> int:
+        """Отправка решения и опрос статуса до завершения проверки."""
+        async with self.http.post(
+            f"{self.base_url}/api/submit", json=self.submission(index)
+        ) as response:
+            body = await response.json()
+            if response.status != 202:
+                return response.status
+
+        while True:
+            await asyncio.sleep(SUBMIT_POLL_INTERVAL)
+            async with self.http.get(
+                f"{self.base_url}/api/submit/{body['job_id']}"
+            ) as response:
+                job = await response.json()
+            if job.get("status") not in ("queued", "running"):
+                return 200 if job.get("status") == "done" else 500
+
+    async def submit_stream(self, index: int) -> int:
+        """Отправка решения с чтением потока событий до итогового."""
+        async with self.http.post(
+            f"{self.base_url}/api/submit",
+            json=self.submission(index),
+            headers={"Accept": "text/event-stream"},
+        ) as response:
+            if response.content_type != "text/event-stream":
+                return response.status
+            async for line in response.content:
+                if line.startswith(b"event: result"):
+                    return 200
+                if line.startswith(b"event: error"):
+                    return 500
+        return 500
+
+    async def generate_task(self, index: int) -> int:
+        user_id = self.users[index % len(self.users)]
+        async with self.http.post(
+            f"{self.base_url}/api/generate-task",
+            json={
+                "initData": self.init_data[user_id],
+                "topic": f"Тема {index % self.args.topics}",
+            },
+        ) as response:
+            await response.read()
+            return response.status
+
+    async def webhook(self, index: int) -> int:
+        user_id = BENCH_USER_BASE * 2 + index
+        text = "/profile" if index % 2 else "/start"
+        update = {
+            "update_id": self.update_base + index,
+            "message": {
+                "message_id": index + 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"hook{index}"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+            },
+        }
+        async with self.http.post(f"{self.base_url}/webhook", json=update) as response:
+            await response.read()
+            return response.status
+
+    async def wait_updates_drained(self, timeout: float = 60):
+        deadline = time.perf_counter() + timeout
+        while self.bot.update_queue.depth and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def run(self) -> List[Dict[str, Any]]:
+        handlers = {
+            "tasks": self.tasks,
+            "getUser": self.get_user,
+            "history": self.history,
+            "submit": self.submit,
+            "submit-stream": self.submit_stream,
+            "generate-task": self.generate_task,
+            "webhook": self.webhook,
+        }
+        results = []
+        connector = aiohttp.TCPConnector(limit=self.args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as self.http:
+            for position, name in enumerate(self.args.scenarios):
+                # У каждого сценария свой диапазон номеров запросов, а прогрев
+                # берёт номера после основного прогона: иначе submit-stream
+                # отправлял бы решения задач, уже решённых в submit, и мерил
+                # ответ «уже решено». Пары (пользователь, задание) не
+                # повторяются, пока номеров меньше users * tasks.
+                first_index = position * (self.args.requests + self.args.warmup)
+                if self.args.warmup:
+                    await drive(
+                        name,
+                        self.args.warmup,
+                        self.args.concurrency,
+                        handlers[name],
+                        first_index=first_index + self.args.requests,
+                    )
+                result = await drive(
+                    name,
+                    self.args.requests,
+                    self.args.concurrency,
+                    handlers[name],
+                    first_index=first_index,
+                )
+                if name == "webhook":
+                    started = time.perf_counter()
+                    await self.wait_updates_drained()
+                    result["drain_s"] = round(time.perf_counter() - started, 3)
+                results.append(result)
+        return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(args: argparse.Namespace, stubs: StubServer):
+    """Переменные окружения читаются модулями при импорте — задаём их до import bot."""
+    os.environ.update(
+        {
+            "BOT_TOKEN": BENCH_BOT_TOKEN,
+            "WEBAPP_URL": "http://127.0.0.1",
+            "DATABASE_URL": args.database_url,
+            "LLM_API_URL": f"{stubs.url}/llm",
+            "HF_API_URL": f"{stubs.url}/hf",
+            "HF_TOKEN": "hf_benchmark",
+            "TELEGRAM_API_URL": f"{stubs.url}/telegram",
+            "SIMILARITY_BACKEND": args.similarity_backend,
+            "ADMISSION_ENABLED": "1" if args.admission else "0",
+        }
+    )
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    stubs = StubServer(
+        llm_latency_ms=args.llm_latency_ms,
+        hf_latency_ms=args.hf_latency_ms,
+        telegram_latency_ms=args.telegram_latency_ms,
+        jitter_ms=args.jitter_ms,
+        review_grade=args.review_grade,
+    )
+    await stubs.start()
+    configure_environment(args, stubs)
+
+    import bot
+
+    logging.getLogger().setLevel(args.log_level)
+    runner = web.AppRunner(bot.create_app(), access_log=None)
+    app_output = open(os.devnull, "w") if not args.verbose else sys.stdout
+    try:
+        with contextlib.redirect_stdout(app_output):
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = runner.addresses[0][1]
+
+            suite = Benchmark(args, bot, f"http://127.0.0.1:{port}")
+            await suite.seed()
+            results = await suite.run()
+    finally:
+        with contextlib.redirect_stdout(app_output):
+            await runner.cleanup()
+            await stubs.stop()
+        if app_output is not sys.stdout:
+            app_output.close()
+
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "database": args.database_url.split("://", 1)[0],
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "users": args.users,
+            "tasks": args.tasks,
+            "similarity_backend": args.similarity_backend,
+            "llm_latency_ms": args.llm_latency_ms,
+            "hf_latency_ms": args.hf_latency_ms,
+            "telegram_latency_ms": args.telegram_latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "cache_hits": args.cache_hits,
+            "tests": args.tests,
+            "admission": args.admission,
+        },
+        "stub_calls": stubs.calls,
+        "results": results,
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    previous = {
+        result["scenario"]: result for result in (baseline or {}).get("results", [])
+    }
+    header = f"{'scenario':<15}{'req':>7}{'err':>6}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in report["results"]:
+        latency = result["latency_ms"]
+        print(
+            f"{result['scenario']:<15}{result['requests']:>7}{result['errors']:>6}"
+            f"{result['throughput_rps'] or 0:>10.1f}{latency['p50'] or 0:>10.2f}"
+            f"{latency['p95'] or 0:>10.2f}{latency['p99'] or 0:>10.2f}"
+        )
+        before = previous.get(result["scenario"])
+        if before and before["throughput_rps"] and before["latency_ms"]["p95"]:
+            rps_change = result["throughput_rps"] / before["throughput_rps"] - 1
+            p95_change = latency["p95"] / before["latency_ms"]["p95"] - 1
+            print(f"{'':<15}{'vs baseline:':>13}{rps_change:>+16.1%}{'':>10}{p95_change:>+10.1%}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="URL базы (по умолчанию временная SQLite через aiosqlite)",
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=20, help="прогревочных запросов")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--topics", type=int, default=20, help="тем для generate-task")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--hf-latency-ms", type=float, default=30)
+    parser.add_argument("--telegram-latency-ms", type=float, default=10)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--review-grade", type=int, default=5)
+    parser.add_argument(
+        "--no-tests",
+        dest="tests",
+        action="store_false",
+        help="задания без скрытых тестов: правильность оценивает только LLM",
+    )
+    parser.add_argument(
+        "--similarity-backend", choices=("local", "huggingface"), default="local"
+    )
+    parser.add_argument(
+        "--cache-hits",
+        action="store_true",
+        help="отправлять одинаковый код, чтобы проверка шла через кэш оценок",
+    )
+    parser.add_argument(
+        "--admission",
+        action="store_true",
+        help="включить лимиты частоты и одновременности (admission.py)",
+    )
+    parser.add_argument("--output", help="куда сохранить JSON с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--verbose", action="store_true", help="не скрывать вывод приложения")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    if args.database_url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+        args.database_url = f"sqlite+aiosqlite:///{path}"
+    if args.output is None:
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        args.output = os.path.join("benchmarks", "results", f"{stamp}.json")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(benchmark(args))
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
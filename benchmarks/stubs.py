@@ -0,0 +1,146 @@
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict
+
+from aiohttp import web
+
+
+REFERENCE_TESTS = [
+    {"input": [[3, 1, 2]], "output": [1, 2, 3]},
+    {"input": [[]], "output": []},
+    {"input": [[5, 5, -1, 0]], "output": [-1, 0, 5, 5]},
+]
+
+REFERENCE_SOLUTION = '''def solution(arr):
+    result = list(arr)
+    for i in range(len(result)):
+        for j in range(len(result) - i - 1):
+            if result[j] > result[j + 1]:
+                result[j], result[j + 1] = result[j + 1], result[j]
+    return result
+'''
+
+
+class StubServer:
+    """
+    Заглушки внешних сервисов для бенчмарков: Hugging Face Inference API,
+    OpenAI-совместимый LLM (вместо провайдера g4f) и Telegram Bot API.
+    Каждый ответ задерживается на latency_ms ± jitter_ms.
+    """
+
+    def __init__(
+        self,
+        llm_latency_ms: float = 0,
+        hf_latency_ms: float = 0,
+        telegram_latency_ms: float = 0,
+        jitter_ms: float = 0,
+        review_grade: int = 5,
+        similarity: float = 0.42,
+    ):
+        self.latency = {
+            "llm": llm_latency_ms,
+            "hf": hf_latency_ms,
+            "telegram": telegram_latency_ms,
+        }
+        self.jitter_ms = jitter_ms
+        self.review_grade = review_grade
+        self.similarity = similarity
+        self.calls: Dict[str, int] = {"llm": 0, "hf": 0, "telegram": 0}
+        self._message_id = 0
+        self._runner = None
+        self.url = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/hf/models/{model:.+}", self.hf_handler)
+        app.router.add_post("/llm/chat/completions", self.llm_handler)
+        app.router.add_post("/telegram/bot{token}/{method}", self.telegram_handler)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _delay(self, service: str):
+        self.calls[service] += 1
+        latency = self.latency[service]
+        if self.jitter_ms:
+            latency += random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    async def hf_handler(self, request: web.Request) -> web.Response:
+        await request.read()
+        await self._delay("hf")
+        return web.json_response([self.similarity])
+
+    async def llm_handler(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        prompt = payload["messages"][-1]["content"]
+        await self._delay("llm")
+        content = json.dumps(self.completion(prompt), ensure_ascii=False)
+        return web.json_response(
+            {
+                "id": f"stub-{self.calls['llm']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+        )
+
+    def review(self) -> Dict[str, Any]:
+        return {
+            criterion: {"grade": self.review_grade, "comment": "stub"}
+            for criterion in ("Правильность", "Оптимальность", "Стиль")
+        }
+
+    def completion(self, prompt: str):
+        if "JSON-массивом" in prompt:
+            count = prompt.count('"code":')
+            return [{"index": index, **self.review()} for index in range(count)]
+        if '"inference"' in prompt:
+            return {
+                "title": "Сортировка пузырьком",
+                "description": "Отсортируйте список по возрастанию.",
+                "difficulty": "Легко",
+                "points": 5,
+                "inference": REFERENCE_SOLUTION,
+                "function_name": "solution",
+                "tests": REFERENCE_TESTS,
+            }
+        return self.review()
+
+    async def telegram_handler(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        await self._delay("telegram")
+        method = request.match_info["method"].lower()
+        if method == "sendmessage":
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        elif method == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bench"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
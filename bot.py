@@ -1,12 +1,19 @@
+import asyncio
+import json
 import logging
 import os
+import sys
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Optional
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
-from aiogram.utils.web_app import check_webapp_signature, safe_parse_webapp_init_data
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiohttp import web
 
 
@@ -22,18 +29,72 @@ from sqlalchemy import (
     Column,
     ForeignKey,
     func,
+    text,
+    exists,
+    cast,
+    tuple_,
 )
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import defer
+from sqlalchemy.dialects.postgresql import JSONB, insert
 from sqlalchemy.future import select
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.user.user import User
 from models.task.task import Task
 from models.user_task.user_task import UserTask
+from models.task_fingerprint.task_fingerprint import TaskFingerprint
+from models.evaluation_cache.evaluation_cache import EvaluationCacheEntry
+from models.evaluation_job.evaluation_job import EvaluationJobRecord
+from models.processed_update.processed_update import ProcessedUpdate
+from models.rate_limit.rate_limit import RateLimit
 from models.base_model import Base
 
-from check_code import perform_comprehensive_evaluation
+from database import (
+    DATABASE_URL,
+    async_read_session,
+    async_session,
+    dispose_engines,
+    engine,
+    pool_stats,
+)
+from check_code import (
+    close_http_session,
+    get_http_session,
+    perform_comprehensive_evaluation_async,
+    summarize_report,
+    warm_up_llm_client,
+)
+from fingerprint_store import get_template_fingerprint
+import evaluation_cache
+from evaluation_cache import cache_stats, get_cached_report, store_report
+import task_catalog
+from evaluation_queue import EVAL_RESULT_TTL, EvaluationQueue, QueueFullError
+from leaderboard import Leaderboard
+from pg_events import PgEventBus
+from webapp_auth import authenticate_request, issue_token
+from admission import (
+    AdmissionRejected,
+    admission_stats,
+    endpoints as admission_endpoints,
+    use_shared_buckets,
+)
+from coordination import (
+    SHARED_STATE_CLEANUP_INTERVAL,
+    WEB_WORKERS,
+    LeaderElection,
+    SharedState,
+    lock_migrations,
+)
+from supervisor import run_workers
+from update_queue import UpdateQueue, UpdateQueueFullError
+from task_generation import TaskGenerator
+from review_batcher import REVIEW_BATCH_SIZE, ReviewBatcher
+from user_stats import USER_STATS_RECONCILE_INTERVAL, reconcile_user_stats
+from static_assets import StaticAssets
+from submission_gates import GATE_STAGES, gate_stats
+from sandbox import SandboxPool
+import metrics
 
 
 logging.basicConfig(level=logging.INFO)
@@ -42,16 +103,184 @@ logger = logging.getLogger(__name__)
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBAPP_URL = os.getenv("WEBAPP_URL")
-DATABASE_URL = os.getenv("DATABASE_URL")
 PORT = int(os.getenv("PORT", 8080))
+# При WEB_WORKERS > 1 /metrics на общем порту отдаёт метрики того воркера,
+# которому достался запрос. Если порт задан, воркер N дополнительно отдаёт
+# свои метрики на WORKER_METRICS_PORT + N — их и нужно собирать по отдельности.
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0))
+# Свой сервер Bot API (локальный telegram-bot-api или заглушка в бенчмарках).
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+TASKS_PAGE_SIZE = int(os.getenv("TASKS_PAGE_SIZE", 100))
+TASKS_PAGE_SIZE_MAX = int(os.getenv("TASKS_PAGE_SIZE_MAX", 500))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 50))
+HISTORY_PAGE_SIZE_MAX = int(os.getenv("HISTORY_PAGE_SIZE_MAX", 500))
+SOLVED_LOOKUP_MAX = int(os.getenv("SOLVED_LOOKUP_MAX", TASKS_PAGE_SIZE_MAX))
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", 15))
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", 10))
+LEADERBOARD_SIZE_MAX = int(os.getenv("LEADERBOARD_SIZE_MAX", 100))
+LEADERBOARD_RESYNC_INTERVAL = float(os.getenv("LEADERBOARD_RESYNC_INTERVAL", 600))
+# Создание схемы и начальных заданий при запуске сервера. В продакшене их
+# выполняет отдельная команда `python bot.py migrate`, а здесь AUTO_MIGRATE=0.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+# Удалять вебхук при остановке. По умолчанию вебхук остаётся: при перезапуске
+# Telegram придержит обновления до возвращения сервера, и они не потеряются.
+DELETE_WEBHOOK_ON_SHUTDOWN = os.getenv("DELETE_WEBHOOK_ON_SHUTDOWN", "0") == "1"
+
+# Идемпотентные изменения схемы для уже существующих баз: create_all
+# не добавляет индексы и колонки в созданные ранее таблицы.
+SCHEMA_UPGRADES = [
+    "CREATE INDEX IF NOT EXISTS ix_user_tasks_task_id ON user_tasks (task_id)",
+    """
+    CREATE INDEX IF NOT EXISTS ix_user_tasks_user_history
+        ON user_tasks (user_id, completed_at, task_id)
+    """,
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS solved_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_solved_at TIMESTAMP WITHOUT TIME ZONE",
+    """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS solved_by_difficulty JSONB
+        NOT NULL DEFAULT '{}'::jsonb
+    """,
+    "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS entry_point VARCHAR(100)",
+    "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS test_cases JSON",
+]
+
+
+# Несколько воркеров (WEB_WORKERS) делят состояние через PostgreSQL.
+shared_state = SharedState(engine, async_session)
+leader = LeaderElection(engine)
+evaluation_queue = EvaluationQueue(
+    on_finish=shared_state.save_job if shared_state.enabled else None
+)
+if shared_state.enabled:
+    use_shared_buckets(shared_state.take_rate_token)
+leaderboard = Leaderboard()
+event_bus = PgEventBus(engine)
+sandbox_pool = SandboxPool()
+task_generator = TaskGenerator(async_session, sandbox=sandbox_pool, event_bus=event_bus)
+review_batcher = ReviewBatcher() if REVIEW_BATCH_SIZE > 1 else None
+static_assets = StaticAssets()
 
 
-engine = create_async_engine(DATABASE_URL)
-async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+dp = Dispatcher()
+bot = Bot(
+    token=BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    if TELEGRAM_API_URL
+    else None,
+    default=DefaultBotProperties(parse_mode="HTML"),
+)
 
 
-dp = Dispatcher()
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+def on_leaderboard_event(data: dict):
+    leaderboard.update(data["user_id"], data["points"], data.get("username"))
+
+
+def on_catalog_event(data: dict):
+    task_catalog.invalidate()
+
+
+event_bus.subscribe("leaderboard", on_leaderboard_event)
+event_bus.subscribe("catalog", on_catalog_event)
+
+
+metrics.register_gauge(
+    "evaluation_queue_depth", "Проверки в очереди", lambda: evaluation_queue.depth
+)
+metrics.register_gauge(
+    "update_queue_depth", "Обновления Telegram в очереди", lambda: update_queue.depth
+)
+metrics.register_gauge(
+    "review_batcher_depth",
+    "Решения, ожидающие пакетного ревью",
+    lambda: review_batcher.depth if review_batcher else 0,
+)
+metrics.register_gauge(
+    "db_pool_checked_out",
+    "Выданные соединения основного пула",
+    lambda: sum(pool["checked_out"] for pool in pool_stats().values()),
+)
+metrics.register_gauge(
+    "admission_waiting",
+    "Запросы, ожидающие места в пределах ограничения одновременности",
+    lambda: sum(endpoint.waiting for endpoint in admission_endpoints.values()),
+)
+metrics.register_counters(
+    "sandbox_events",
+    "Воркеры песочницы, заменённые после сбоя",
+    "event",
+    lambda: {"respawns": sandbox_pool.respawns},
+)
+metrics.register_counters(
+    "evaluation_cache_events",
+    "Обращения к кэшу оценок",
+    "event",
+    lambda: evaluation_cache.stats,
+)
+metrics.register_counters(
+    "review_batcher_events",
+    "Пакетное ревью: решения, пакеты, одиночные перепроверки",
+    "event",
+    lambda: review_batcher.counters if review_batcher else {},
+)
+
+
+async def publish_points(
+    session: AsyncSession, user_id: int, points: int, username: str = None
+):
+    """Сообщает другим воркерам новые баллы пользователя (доставка после commit)."""
+    await event_bus.publish(
+        session,
+        "leaderboard",
+        {"user_id": user_id, "points": points, "username": username},
+    )
+
+
+async def rebuild_leaderboard():
+    # Решения и NOTIFY, пришедшие во время SELECT, не теряются при замене.
+    pending = leaderboard.begin_rebuild()
+    try:
+        async with async_session() as session:
+            rows = (
+                await session.execute(select(User.id, User.username, User.points))
+            ).all()
+    except BaseException:
+        leaderboard.abort_rebuild(pending)
+        raise
+    leaderboard.rebuild(rows, pending)
+    logger.info(f"Leaderboard rebuilt: {len(leaderboard)} users")
+
+
+async def leaderboard_resync_loop():
+    while True:
+        await asyncio.sleep(LEADERBOARD_RESYNC_INTERVAL)
+        try:
+            await rebuild_leaderboard()
+        except Exception as e:
+            logger.error(f"Leaderboard resync failed: {e}", exc_info=True)
+
+
+async def reconcile_stats():
+    """Исправляет расхождения статистики пользователей и их баллы в рейтинге."""
+    if engine.dialect.name != "postgresql":
+        return
+    async with async_session() as session:
+        rows = await reconcile_user_stats(session)
+        for row in rows:
+            await publish_points(session, row.id, row.points, row.username)
+        await session.commit()
+    for row in rows:
+        leaderboard.update(row.id, row.points, row.username)
+
+
+async def user_stats_reconcile_loop():
+    while True:
+        await asyncio.sleep(USER_STATS_RECONCILE_INTERVAL)
+        if not leader.is_leader:
+            continue
+        try:
+            await reconcile_stats()
+        except Exception as e:
+            logger.error(f"User stats reconcile failed: {e}", exc_info=True)
 
 
 @dp.message(Command("start"))
@@ -62,9 +291,11 @@ async def start_command(message: types.Message, session: AsyncSession):
     result = await session.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
     if not user:
-        user = User(id=user_id, username=username)
+        user = User(id=user_id, username=username, points=0)
         session.add(user)
+        await publish_points(session, user_id, 0, username)
         await session.commit()
+        leaderboard.update(user_id, 0, username)
         logger.info(f"New user registered: {username} ({user_id})")
 
     keyboard = InlineKeyboardMarkup(
@@ -84,31 +315,37 @@ async def start_command(message: types.Message, session: AsyncSession):
 
 
 @dp.message(Command("profile"))
-async def profile_command(message: types.Message, session: AsyncSession):
-    result = await session.execute(
-        select(User)
-        .options(selectinload(User.task_completions))
-        .where(User.id == message.from_user.id)
-    )
-    user = result.scalar_one_or_none()
+async def profile_command(message: types.Message):
+    async with async_read_session() as session:
+        user = await session.get(User, message.from_user.id)
     if not user:
         await message.answer("Вы не зарегистрированы. Используйте /start")
         return
 
-    await session.refresh(user, ["task_completions"])
-
-    profile_text = (
-        f"👤 <b>Профиль</b>\n\n"
-        f"Имя: {user.username}\n"
-        f"Баллы: {user.points}\n"
-        f"Решено задач: {len(user.task_completions)}\n"
-        f"Дата регистрации: {user.registered_at.strftime('%d.%m.%Y')}"
-    )
+    solved = f"Решено задач: {user.solved_count}"
+    if user.solved_by_difficulty:
+        solved += " (" + ", ".join(
+            f"{difficulty}: {count}"
+            for difficulty, count in user.solved_by_difficulty.items()
+        ) + ")"
+    lines = [
+        "👤 <b>Профиль</b>\n",
+        f"Имя: {user.username}",
+        f"Баллы: {user.points}",
+        solved,
+    ]
+    if user.last_solved_at:
+        lines.append(f"Последнее решение: {user.last_solved_at.strftime('%d.%m.%Y')}")
+    lines += [
+        f"Место в рейтинге: {leaderboard.rank(user.id) or '—'}",
+        f"Дата регистрации: {user.registered_at.strftime('%d.%m.%Y')}",
+    ]
+    profile_text = "\n".join(lines)
     await message.answer(profile_text)
 
 
 @dp.message(Command("newtask"))
-async def create_new_task(message: types.Message, session: AsyncSession):
+async def create_new_task(message: types.Message):
     topic = message.text.replace("/newtask", "").strip()
     if not topic:
         await message.answer(
@@ -119,9 +356,7 @@ async def create_new_task(message: types.Message, session: AsyncSession):
     await message.answer("Генерирую новое задание, пожалуйста, подождите...")
 
     try:
-        task = await Task.generate_task_from_topic(topic)
-        session.add(task)
-        await session.commit()
+        task = await task_generator.get_task(topic)
 
         await message.answer(
             f"✅ Создано новое задание!\n\n"
@@ -134,40 +369,58 @@ async def create_new_task(message: types.Message, session: AsyncSession):
         await message.answer("Не удалось сгенерировать задание. Попробуйте позже.")
 
 
+# Маршруты, обработчикам которых нужна сессия БД в request["session"]:
+# "read" — только чтение (реплика, если настроена), "write" — основная БД.
+# Страницы каталога кэшируются до следующей инвалидации, поэтому собираются
+# по основной БД: отстающая реплика сразу после invalidate() закэшировала бы
+# старую страницу. Попадания в кэш к БД не обращаются.
+SESSION_ROUTES = {
+    "/api/getUser": "read",
+    "/api/tasks": "write",
+    "/api/history": "read",
+    "/api/solved": "read",
+    "/api/submit": "write",
+}
+
+
 @web.middleware
 async def db_session_middleware(request: web.Request, handler):
-    async with async_session() as session:
+    resource = request.match_info.route.resource
+    mode = SESSION_ROUTES.get(resource.canonical) if resource is not None else None
+    if mode is None:
+        return await handler(request)
+    session_factory = async_read_session if mode == "read" else async_session
+    async with session_factory() as session:
         request["session"] = session
         response = await handler(request)
         return response
 
 
 async def webapp_handler(request: web.Request) -> web.Response:
-    return web.FileResponse("static/index.html")
+    return static_assets.response(request, "index.html")
 
 
 async def api_get_user_handler(request: web.Request) -> web.Response:
     try:
         data = await request.json()
-        init_data = data.get("initData")
+        user_id = authenticate_request(request, data)
 
-        if not check_webapp_signature(BOT_TOKEN, init_data):
+        if user_id is None:
             return web.json_response(
                 {"ok": False, "error": "Invalid signature"}, status=401
             )
 
-        webapp_data = safe_parse_webapp_init_data(BOT_TOKEN, init_data=init_data)
-
         session: AsyncSession = request["session"]
 
-        user_id = webapp_data.user.id
         result = await session.execute(select(User).where(User.id == user_id))
         user = result.scalar_one_or_none()
 
         if user:
-
-            user_dict = await session.run_sync(lambda _: user.to_dict())
-            return web.json_response({"ok": True, "user": user_dict})
+            user_dict = user.to_dict()
+            user_dict["rank"] = leaderboard.rank(user_id)
+            return web.json_response(
+                {"ok": True, "user": user_dict, "token": issue_token(user_id)}
+            )
         else:
             return web.json_response(
                 {"ok": False, "error": "User not found"}, status=404
@@ -178,32 +431,198 @@ async def api_get_user_handler(request: web.Request) -> web.Response:
 
 
 async def api_tasks_handler(request: web.Request) -> web.Response:
+    limit = page_limit(request, TASKS_PAGE_SIZE, TASKS_PAGE_SIZE_MAX)
+    if limit is None:
+        return web.json_response({"ok": False, "error": "Invalid limit"}, status=400)
     try:
-        session: AsyncSession = request["session"]
+        after = int(request.query["after"]) if request.query.get("after") else None
+    except ValueError:
+        return web.json_response({"ok": False, "error": "Invalid cursor"}, status=400)
 
-        result = await session.execute(
-            select(Task).options(selectinload(Task.user_completions))
-        )
-        tasks_raw = result.scalars().all()
+    try:
+        difficulty = request.query.get("difficulty")
+
+        page_key = (after, limit, difficulty)
+        page = task_catalog.get_page(page_key)
+        if page is None:
+            catalog_version = task_catalog.version()
+            body = await load_tasks_page(request["session"], after, limit, difficulty)
+            etag = task_catalog.put_page(page_key, body, catalog_version)
+        else:
+            body, etag = page
 
-        tasks = await session.run_sync(lambda _: [task.to_dict() for task in tasks_raw])
-        return web.json_response({"ok": True, "tasks": tasks})
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(
+            body=body, content_type="application/json", headers=headers
+        )
     except Exception as e:
         logger.error(f"Get tasks error: {e}", exc_info=True)
         return web.json_response({"ok": False, "error": str(e)}, status=500)
 
 
+async def load_tasks_page(
+    session: AsyncSession, after: Optional[int], limit: int, difficulty
+) -> bytes:
+    completion_count = (
+        select(func.count())
+        .select_from(UserTask)
+        .where(UserTask.task_id == Task.id)
+        .correlate(Task)
+        .scalar_subquery()
+    )
+    query = (
+        select(Task, completion_count.label("completion_count"))
+        .options(defer(Task.inference), defer(Task.test_cases))
+        .order_by(Task.id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.where(Task.id > after)
+    if difficulty:
+        query = query.where(Task.difficulty == difficulty)
+
+    rows = (await session.execute(query)).all()
+    next_cursor = rows[limit - 1][0].id if len(rows) > limit else None
+
+    tasks = [task.to_dict(completion_count=count) for task, count in rows[:limit]]
+    return json.dumps({"ok": True, "tasks": tasks, "next_cursor": next_cursor}).encode(
+        "utf-8"
+    )
+
+
+def encode_history_cursor(completed_at: datetime, task_id: int) -> str:
+    return f"{completed_at.isoformat()}_{task_id}"
+
+
+def page_limit(request: web.Request, default: int, maximum: int) -> Optional[int]:
+    """Параметр limit в пределах от 1 до maximum; None, если это не число."""
+    try:
+        return max(1, min(int(request.query.get("limit", default)), maximum))
+    except ValueError:
+        return None
+
+
+def decode_history_cursor(cursor: str):
+    completed_at, _, task_id = cursor.rpartition("_")
+    return datetime.fromisoformat(completed_at), int(task_id)
+
+
+async def api_history_handler(request: web.Request) -> web.Response:
+    """
+    История решений пользователя, новые сначала. Страница — один запрос
+    user_tasks JOIN tasks по индексу (user_id, completed_at, task_id);
+    продолжение — по next_cursor.
+    """
+    user_id = authenticate_request(request, {})
+    if user_id is None:
+        return web.json_response({"ok": False, "error": "Invalid signature"}, status=401)
+
+    limit = page_limit(request, HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE_MAX)
+    if limit is None:
+        return web.json_response({"ok": False, "error": "Invalid limit"}, status=400)
+    cursor = request.query.get("cursor")
+    try:
+        position = decode_history_cursor(cursor) if cursor else None
+    except ValueError:
+        return web.json_response({"ok": False, "error": "Invalid cursor"}, status=400)
+
+    try:
+        query = (
+            select(
+                UserTask.task_id,
+                UserTask.earned_points,
+                UserTask.completed_at,
+                Task.title,
+                Task.difficulty,
+            )
+            .join(Task, Task.id == UserTask.task_id)
+            .where(UserTask.user_id == user_id)
+            .order_by(UserTask.completed_at.desc(), UserTask.task_id.desc())
+            .limit(limit + 1)
+        )
+        if position is not None:
+            query = query.where(
+                tuple_(UserTask.completed_at, UserTask.task_id) < tuple_(*position)
+            )
+
+        rows = (await request["session"].execute(query)).all()
+        next_cursor = (
+            encode_history_cursor(rows[limit - 1].completed_at, rows[limit - 1].task_id)
+            if len(rows) > limit
+            else None
+        )
+        items = [
+            {
+                "id": row.task_id,
+                "title": row.title,
+                "difficulty": row.difficulty,
+                "points": row.earned_points,
+                "completed_at": row.completed_at.isoformat(),
+            }
+            for row in rows[:limit]
+        ]
+        return web.json_response(
+            {"ok": True, "items": items, "next_cursor": next_cursor}
+        )
+    except Exception as e:
+        logger.error(f"History error: {e}", exc_info=True)
+        return web.json_response({"ok": False, "error": str(e)}, status=500)
+
+
+async def api_solved_handler(request: web.Request) -> web.Response:
+    """
+    Какие из заданий ids (через запятую, не больше SOLVED_LOOKUP_MAX) решены
+    пользователем. Отметки для страницы каталога — поиск по первичному ключу
+    user_tasks, без обхода всей истории.
+    """
+    user_id = authenticate_request(request, {})
+    if user_id is None:
+        return web.json_response({"ok": False, "error": "Invalid signature"}, status=401)
+
+    try:
+        task_ids = {int(value) for value in request.query.get("ids", "").split(",") if value}
+    except ValueError:
+        return web.json_response({"ok": False, "error": "Invalid ids"}, status=400)
+    if len(task_ids) > SOLVED_LOOKUP_MAX:
+        return web.json_response({"ok": False, "error": "Too many ids"}, status=400)
+    if not task_ids:
+        return web.json_response({"ok": True, "solved": []})
+
+    try:
+        rows = await request["session"].execute(
+            select(UserTask.task_id).where(
+                UserTask.user_id == user_id, UserTask.task_id.in_(task_ids)
+            )
+        )
+        return web.json_response({"ok": True, "solved": sorted(rows.scalars())})
+    except Exception as e:
+        logger.error(f"Solved lookup error: {e}", exc_info=True)
+        return web.json_response({"ok": False, "error": str(e)}, status=500)
+
+
 async def api_generate_task(request: web.Request) -> web.Response:
-    session: AsyncSession = request["session"]
+    admission = admission_endpoints["generate-task"]
     try:
+        await admission.check_ip(request)
         data = await request.json()
+        user_id = authenticate_request(request, data)
+        if user_id is None:
+            return web.json_response(
+                {"ok": False, "error": "Invalid signature"}, status=401
+            )
+        await admission.check_user(user_id)
         topic = data.get("topic", "Программирование")
 
-        task = await Task.generate_task_from_topic(topic)
-        session.add(task)
-        await session.commit()
+        async with admission.slot():
+            task = await task_generator.get_task(topic, data.get("difficulty"))
 
-        return web.json_response({"ok": True, "task": task.to_dict()})
+        return web.json_response(
+            {"ok": True, "task": task.to_dict(completion_count=0)}
+        )
+    except AdmissionRejected as e:
+        return e.to_response()
     except Exception as e:
         logger.error(f"Error generating task: {e}")
         return web.json_response(
@@ -211,132 +630,509 @@ async def api_generate_task(request: web.Request) -> web.Response:
         )
 
 
+def increment_difficulty_count(difficulty: str):
+    """Выражение для solved_by_difficulty с увеличенным счётчиком сложности."""
+    count = func.coalesce(User.solved_by_difficulty[difficulty].as_integer(), 0) + 1
+    if engine.dialect.name == "postgresql":
+        return User.solved_by_difficulty.op("||", return_type=JSONB)(
+            func.jsonb_build_object(cast(difficulty, String), count)
+        )
+    return func.json_set(User.solved_by_difficulty, f'$."{difficulty}"', count)
+
+
+async def record_completion(
+    session: AsyncSession,
+    user_id: int,
+    task_id: int,
+    earned_points: int,
+    difficulty: str = None,
+):
+    """
+    Атомарно записывает решение и обновляет статистику пользователя одним
+    запросом: INSERT ... ON CONFLICT DO NOTHING в user_tasks и UPDATE users
+    (баллы, число решённых задач, время последнего решения, счётчики по
+    сложности) по его результату. Возвращает (points, solved_count, username)
+    или None, если задача уже была решена параллельным запросом.
+    """
+    completed_at = datetime.utcnow()
+    insert_completion = (
+        insert(UserTask)
+        .values(
+            user_id=user_id,
+            task_id=task_id,
+            earned_points=earned_points,
+            completed_at=completed_at,
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "task_id"])
+        .returning(UserTask.user_id, UserTask.earned_points)
+    )
+    stats = {
+        "solved_count": User.solved_count + 1,
+        "last_solved_at": completed_at,
+    }
+    if difficulty:
+        stats["solved_by_difficulty"] = increment_difficulty_count(difficulty)
+
+    if engine.dialect.name != "postgresql":
+        # SQLite (локальные запуски, бенчмарки) не поддерживает DML в CTE.
+        if (await session.execute(insert_completion)).first() is None:
+            return None
+        statement = (
+            update(User)
+            .where(User.id == user_id)
+            .values(points=User.points + earned_points, **stats)
+            .returning(User.points, User.solved_count, User.username)
+        )
+        return (await session.execute(statement)).first()
+
+    inserted = insert_completion.cte("inserted")
+    statement = (
+        update(User)
+        .where(User.id == inserted.c.user_id)
+        .values(points=User.points + inserted.c.earned_points, **stats)
+        .returning(User.points, User.solved_count, User.username)
+        .add_cte(inserted)
+    )
+    return (await session.execute(statement)).first()
+
+
+def test_runner_for(task: Task):
+    """Прогон по скрытым тестам задания в песочнице, если тесты и пул есть."""
+    if not (task.test_cases and task.entry_point and sandbox_pool.available):
+        return None
+    return lambda code: sandbox_pool.run(code, task.entry_point, task.test_cases)
+
+
+async def evaluate_submission(
+    user_id: int, task_id: int, code: str, progress=None
+) -> dict:
+    async with async_session() as session:
+        task = await session.get(Task, task_id)
+
+        final_report = await get_cached_report(session, task_id, code)
+        if final_report is not None and progress is not None:
+            progress("cached", final_report)
+        if final_report is None:
+            template_fingerprint = None
+            if task.inference:
+                template_fingerprint = await get_template_fingerprint(
+                    session, task.inference
+                )
+
+            final_report = await perform_comprehensive_evaluation_async(
+                template_code=task.inference,
+                submitted_code=code,
+                algorithm_name=task.title,
+                template_fingerprint=template_fingerprint,
+                reviewer=review_batcher.review if review_batcher else None,
+                test_runner=test_runner_for(task),
+                progress=progress,
+            )
+            # Отказы локальных проверок дешевле пересчитать, чем хранить.
+            if final_report.get("short_circuit") not in GATE_STAGES:
+                await store_report(session, task_id, code, final_report)
+
+        points, is_correct = summarize_report(final_report)
+
+        if is_correct > 3:
+            completion = await record_completion(
+                session, user_id, task_id, round(points), task.difficulty
+            )
+            if completion is None:
+                await session.rollback()
+                return {"passed": False, "message": "Вы уже решили эту задачу!"}
+
+            await publish_points(
+                session, user_id, completion.points, completion.username
+            )
+            await event_bus.publish(session, "catalog", {"task_id": task_id})
+            await session.commit()
+            task_catalog.invalidate()
+            leaderboard.update(user_id, completion.points, completion.username)
+
+            return {
+                "passed": True,
+                "message": f"Отлично! Задача решена. Вам начислено {task.points} баллов.",
+                "new_points": completion.points,
+                "new_completed_count": completion.solved_count,
+                "rank": leaderboard.rank(user_id),
+            }
+        else:
+            message = "Решение неверное. Попробуйте еще раз."
+            if final_report.get("short_circuit") or "tests" in final_report:
+                message += " " + final_report["Правильность"]["comment"]
+            return {"passed": False, "message": message}
+
+
 async def api_submit_handler(request: web.Request) -> web.Response:
     session: AsyncSession = request["session"]
+    admission = admission_endpoints["submit"]
     try:
+        await admission.check_ip(request)
         data = await request.json()
-        init_data = data.get("initData")
+        user_id = authenticate_request(request, data)
 
-        if not check_webapp_signature(BOT_TOKEN, init_data):
+        if user_id is None:
             return web.json_response(
                 {"ok": False, "error": "Invalid signature"}, status=401
             )
+        await admission.check_user(user_id)
 
-        webapp_data = safe_parse_webapp_init_data(BOT_TOKEN, init_data=init_data)
-        user_id = webapp_data.user.id
         task_id = int(data.get("taskId"))
-
-        result_user = await session.execute(
-            select(User)
-            .options(selectinload(User.task_completions))
-            .where(User.id == user_id)
-        )
-        user = result_user.scalar_one_or_none()
-        result_task = await session.execute(select(Task).where(Task.id == task_id))
-        task = result_task.scalar_one_or_none()
-
-        existing_completion = await session.execute(
-            select(UserTask).where(
-                UserTask.user_id == user_id, UserTask.task_id == task_id
+        code = data.get("code")
+
+        precheck = (
+            await session.execute(
+                select(
+                    exists().where(User.id == user_id).label("user_exists"),
+                    exists().where(Task.id == task_id).label("task_exists"),
+                    exists()
+                    .where(UserTask.user_id == user_id, UserTask.task_id == task_id)
+                    .label("solved"),
+                )
             )
-        )
-        completion = existing_completion.scalar_one_or_none()
+        ).one()
 
-        if completion:
+        if not precheck.user_exists:
+            return web.json_response(
+                {"ok": False, "error": "User not found"}, status=404
+            )
+        if not precheck.task_exists:
+            return web.json_response(
+                {"ok": False, "error": "Task not found"}, status=404
+            )
+        if precheck.solved:
             return web.json_response(
                 {"ok": True, "passed": False, "message": "Вы уже решили эту задачу!"}
             )
 
-        points, is_correct = perform_comprehensive_evaluation(
-            template_code=task.inference,
-            submitted_code=data.get("code"),
-            algorithm_name=task.title,
+        try:
+            job = evaluation_queue.submit(
+                lambda progress: evaluate_submission(user_id, task_id, code, progress)
+            )
+        except QueueFullError:
+            admission.record("shed_queue_full")
+            return web.json_response(
+                {"ok": False, "error": "Сервер перегружен, попробуйте позже"},
+                status=503,
+                headers={"Retry-After": "5"},
+            )
+        admission.record("accepted")
+        if shared_state.enabled:
+            # Запрос статуса может прийти на другой воркер.
+            await shared_state.save_job(job)
+
+        if wants_event_stream(request):
+            # Соединение с БД не должно держаться, пока идёт поток.
+            await session.close()
+            return await stream_job_events(request, job)
+        return web.json_response({"ok": True, **job.to_dict()}, status=202)
+
+    except AdmissionRejected as e:
+        return e.to_response()
+    except Exception as e:
+        logger.error(f"Submit error: {e}", exc_info=True)
+        return web.json_response(
+            {"ok": False, "error": "Submission failed"}, status=500
         )
 
-        if is_correct > 3:
 
-            new_completion = UserTask(
-                user_id=user_id, task_id=task_id, earned_points=points
-            )
-            session.add(new_completion)
-            user.points += points
+async def find_job(job_id: str):
+    """Проверка этого воркера или, в режиме нескольких воркеров, запись из БД."""
+    job = evaluation_queue.get(job_id)
+    if job is None and shared_state.enabled:
+        job = await shared_state.load_job(job_id)
+    return job
 
-            await session.commit()
 
-            return web.json_response(
-                {
-                    "ok": True,
-                    "passed": True,
-                    "message": f"Отлично! Задача решена. Вам начислено {task.points} баллов.",
-                    "new_points": user.points,
-                    "new_completed_count": len(user.task_completions),
-                }
-            )
-        else:
-            return web.json_response(
-                {
-                    "ok": True,
-                    "passed": False,
-                    "message": "Решение неверное. Попробуйте еще раз.",
-                }
+async def api_submit_status_handler(request: web.Request) -> web.Response:
+    job = await find_job(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"ok": False, "error": "Job not found"}, status=404)
+    return web.json_response({"ok": True, **job.to_dict()})
+
+
+def wants_event_stream(request: web.Request) -> bool:
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+
+async def stream_job_events(
+    request: web.Request, job, after: int = 0
+) -> web.StreamResponse:
+    """
+    Отдаёт события проверки как Server-Sent Events. id события — его номер,
+    поэтому после обрыва клиент продолжает с GET /api/submit/{job_id}/events
+    и заголовком Last-Event-ID, не отправляя решение повторно.
+    """
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+    await response.prepare(request)
+    try:
+        async for event in job.follow(after, keepalive=SSE_KEEPALIVE):
+            if event is None:
+                await response.write(b": keep-alive\n\n")
+                continue
+            data = json.dumps(event["data"], ensure_ascii=False, default=str)
+            await response.write(
+                f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n".encode(
+                    "utf-8"
+                )
             )
+    except ConnectionResetError:
+        # Клиент отключился; проверка продолжается, результат остаётся в задаче.
+        pass
+    return response
 
-    except Exception as e:
-        logger.error(f"Submit error: {e}", exc_info=True)
+
+async def api_submit_events_handler(request: web.Request) -> web.StreamResponse:
+    job = await find_job(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"ok": False, "error": "Job not found"}, status=404)
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.query.get("after", 0))
+    except ValueError:
         return web.json_response(
-            {"ok": False, "error": "Submission failed"}, status=500
+            {"ok": False, "error": "Invalid Last-Event-ID"}, status=400
         )
+    return await stream_job_events(request, job, after)
 
 
-async def on_startup(app: web.Application):
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        async with async_session(bind=conn) as session:
-            if not (await session.execute(select(Task))).scalars().first():
-                initial_tasks = [
-                    Task(
-                        title="Основы Python",
-                        description="Напишите функцию для сортировки массива",
-                        difficulty="Легко",
-                        points=5,
-                    ),
-                    Task(
-                        title="Алгоритмы",
-                        description="Реализуйте алгоритм поиска в глубину",
-                        difficulty="Средне",
-                        points=5,
-                    ),
-                    Task(
-                        title="Структуры данных",
-                        description="Создайте класс для работы с бинарным деревом",
-                        difficulty="Сложно",
-                        points=5,
-                    ),
-                ]
-                session.add_all(initial_tasks)
-                await session.commit()
-                logger.info("Initial tasks have been added to the database.")
+async def api_eval_cache_stats_handler(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True, "stats": cache_stats()})
+
+
+async def api_review_stats_handler(request: web.Request) -> web.Response:
+    if review_batcher is None:
+        return web.json_response({"ok": True, "batching": False})
+    return web.json_response(
+        {"ok": True, "batching": True, "stats": review_batcher.stats()}
+    )
+
+
+async def api_admission_stats_handler(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True, **admission_stats()})
+
+
+async def api_evaluation_stats_handler(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True, "stats": gate_stats()})
 
+
+async def api_db_stats_handler(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True, "pools": pool_stats()})
+
+
+async def api_leaderboard_handler(request: web.Request) -> web.Response:
+    limit = page_limit(request, LEADERBOARD_SIZE, LEADERBOARD_SIZE_MAX)
+    if limit is None:
+        return web.json_response({"ok": False, "error": "Invalid limit"}, status=400)
+    return web.json_response(
+        {"ok": True, "total": len(leaderboard), "leaders": leaderboard.top(limit)}
+    )
+
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(
+            f"Startup phase {name}: {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+
+
+INITIAL_TASKS = [
+    {
+        "title": "Основы Python",
+        "description": "Напишите функцию для сортировки массива",
+        "difficulty": "Легко",
+        "points": 5,
+    },
+    {
+        "title": "Алгоритмы",
+        "description": "Реализуйте алгоритм поиска в глубину",
+        "difficulty": "Средне",
+        "points": 5,
+    },
+    {
+        "title": "Структуры данных",
+        "description": "Создайте класс для работы с бинарным деревом",
+        "difficulty": "Сложно",
+        "points": 5,
+    },
+]
+
+
+async def migrate():
+    """Создаёт таблицы, применяет SCHEMA_UPGRADES и добавляет начальные задания."""
+    async with engine.begin() as conn:
+        await lock_migrations(conn)
+        with startup_phase("create_all"):
+            await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "postgresql":
+            with startup_phase("schema_upgrades"):
+                for statement in SCHEMA_UPGRADES:
+                    await conn.execute(text(statement))
+        with startup_phase("seed"):
+            async with async_session(bind=conn) as session:
+                if not (await session.execute(select(Task.id).limit(1))).first():
+                    session.add_all(Task(**task) for task in INITIAL_TASKS)
+                    await session.commit()
+                    task_catalog.invalidate()
+                    logger.info("Initial tasks have been added to the database.")
+
+
+async def ensure_webhook():
+    """Регистрирует вебхук, только если Telegram знает другой адрес."""
     webhook_url = f"{WEBAPP_URL}/webhook"
+    info = await bot.get_webhook_info()
+    if info.url == webhook_url:
+        logger.info(f"Webhook already set to {webhook_url}")
+        return
     await bot.set_webhook(webhook_url, drop_pending_updates=True)
     logger.info(f"Webhook set to {webhook_url}")
 
 
+async def warm_up():
+    """
+    Прогрев после того, как сервер начал принимать запросы: пул соединений
+    БД, HTTP-клиент, импорт g4f, рейтинг. Ошибка одной фазы не мешает
+    остальным.
+    """
+    phases = [
+        ("db_pool", warm_up_db_pool),
+        ("http_client", warm_up_http_client),
+        ("llm_client", lambda: asyncio.to_thread(warm_up_llm_client)),
+        ("leaderboard", rebuild_leaderboard),
+    ]
+    started = time.perf_counter()
+    for name, phase in phases:
+        try:
+            with startup_phase(f"warm_up.{name}"):
+                await phase()
+        except Exception as e:
+            logger.error(f"Warm-up phase {name} failed: {e}", exc_info=True)
+    logger.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+async def on_elected():
+    """Однократные задачи ведущего воркера."""
+    with startup_phase("leader.webhook"):
+        await ensure_webhook()
+    with startup_phase("leader.user_stats"):
+        await reconcile_stats()
+
+
+async def shared_state_cleanup_loop():
+    while True:
+        await asyncio.sleep(SHARED_STATE_CLEANUP_INTERVAL)
+        if not leader.is_leader:
+            continue
+        try:
+            await shared_state.cleanup(EVAL_RESULT_TTL)
+        except Exception as e:
+            logger.error(f"Shared state cleanup failed: {e}", exc_info=True)
+
+
+async def warm_up_db_pool():
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def warm_up_http_client():
+    get_http_session()
+
+
+async def on_startup(app: web.Application):
+    # Воркеры песочницы создаются fork'ом, пока у процесса мало потоков и соединений.
+    with startup_phase("sandbox"):
+        await sandbox_pool.start()
+    with startup_phase("static_assets"):
+        static_assets.load()
+    with startup_phase("queues"):
+        await evaluation_queue.start()
+        await update_queue.start()
+        await task_generator.start()
+        if review_batcher:
+            await review_batcher.start()
+
+    if AUTO_MIGRATE:
+        await migrate()
+
+    with startup_phase("event_bus"):
+        await event_bus.start()
+    app["leaderboard_resync"] = asyncio.create_task(leaderboard_resync_loop())
+    app["user_stats_reconcile"] = asyncio.create_task(user_stats_reconcile_loop())
+    app["shared_state_cleanup"] = asyncio.create_task(shared_state_cleanup_loop())
+    # Запускаются сейчас, а выполняются, пока сервер уже слушает порт.
+    app["warm_up"] = asyncio.create_task(warm_up())
+    await leader.start(on_elected)
+    app["metrics_server"] = None
+    if WEB_WORKERS > 1 and WORKER_METRICS_PORT:
+        app["metrics_server"] = await metrics.start_metrics_server(
+            WORKER_METRICS_PORT + app.get("worker", 0)
+        )
+
+
 async def on_shutdown(app: web.Application):
-    await bot.delete_webhook()
-    logger.info("Webhook deleted")
+    app["warm_up"].cancel()
+    app["leaderboard_resync"].cancel()
+    app["user_stats_reconcile"].cancel()
+    app["shared_state_cleanup"].cancel()
+    # Принятые обновления дорабатываются, пока живы шина событий, песочница и БД.
+    await update_queue.stop()
+    if app["metrics_server"] is not None:
+        await app["metrics_server"].cleanup()
+    await leader.stop()
+    await event_bus.stop()
+    await task_generator.stop()
+    if review_batcher:
+        await review_batcher.stop()
+    await evaluation_queue.stop()
+    await sandbox_pool.stop()
+    await close_http_session()
+    await dispose_engines()
+    if DELETE_WEBHOOK_ON_SHUTDOWN:
+        await bot.delete_webhook()
+        logger.info("Webhook deleted")
+    await bot.session.close()
+
+
+async def process_update(update: types.Update):
+    async with async_session() as session:
+        await dp.feed_update(bot=bot, update=update, session=session)
+
+
+update_queue = UpdateQueue(process_update)
 
 
 async def webhook_handler(request: web.Request):
     update_data = await request.json()
     update = types.Update.model_validate(update_data, context={"bot": bot})
-    async with async_session() as session:
-        await dp.feed_update(bot=bot, update=update, session=session)
+    if update_queue.is_duplicate(update.update_id):
+        return web.Response()
+    # Повтор обновления от Telegram может прийти на другой воркер.
+    if shared_state.enabled and not await shared_state.claim_update(update.update_id):
+        return web.Response()
+    try:
+        update_queue.put(update)
+    except UpdateQueueFullError:
+        logger.warning(f"Update queue is unavailable, update {update.update_id} rejected")
+        if shared_state.enabled:
+            await shared_state.release_update(update.update_id)
+        return web.Response(status=503)
     return web.Response()
 
 
-def main():
-    app = web.Application(middlewares=[db_session_middleware])
+def create_app() -> web.Application:
+    app = web.Application(
+        middlewares=[metrics.metrics_middleware, db_session_middleware]
+    )
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
 
@@ -346,9 +1142,52 @@ def main():
     app.router.add_post("/api/getUser", api_get_user_handler)
     app.router.add_get("/api/tasks", api_tasks_handler)
     app.router.add_post("/api/submit", api_submit_handler)
+    app.router.add_get("/api/submit/{job_id}", api_submit_status_handler)
+    app.router.add_get("/api/submit/{job_id}/events", api_submit_events_handler)
+    app.router.add_get("/api/history", api_history_handler)
+    app.router.add_get("/api/solved", api_solved_handler)
+    app.router.add_get("/api/eval-cache/stats", api_eval_cache_stats_handler)
+    app.router.add_get("/api/leaderboard", api_leaderboard_handler)
+    app.router.add_get("/api/review/stats", api_review_stats_handler)
+    app.router.add_get("/api/db/stats", api_db_stats_handler)
+    app.router.add_get("/api/evaluation/stats", api_evaluation_stats_handler)
+    app.router.add_get("/api/admission/stats", api_admission_stats_handler)
     app.router.add_post("/api/generate-task", api_generate_task)
+    app.router.add_get("/metrics", metrics.metrics_handler)
+    return app
+
+
+async def run_migrate():
+    try:
+        await migrate()
+    finally:
+        await dispose_engines()
+        await bot.session.close()
 
-    web.run_app(app, host="0.0.0.0", port=PORT)
+
+def serve(worker: int = 0):
+    app = create_app()
+    app["worker"] = worker
+    if WEB_WORKERS > 1:
+        metrics.label_worker(worker)
+    web.run_app(app, host="0.0.0.0", port=PORT, reuse_port=WEB_WORKERS > 1)
+
+
+def main():
+    if WEB_WORKERS <= 1:
+        serve()
+        return
+    if engine.dialect.name != "postgresql":
+        logger.warning(
+            "WEB_WORKERS > 1 without PostgreSQL: state is not shared between workers"
+        )
+    global AUTO_MIGRATE
+    if AUTO_MIGRATE:
+        # Миграции выполняются один раз до запуска воркеров.
+        asyncio.run(run_migrate())
+        AUTO_MIGRATE = False
+    logger.info(f"Starting {WEB_WORKERS} workers on port {PORT}")
+    run_workers(serve, WEB_WORKERS)
 
 
 if __name__ == "__main__":
@@ -356,5 +1195,7 @@ if __name__ == "__main__":
         logger.critical(
             "Необходимые переменные окружения не установлены! (BOT_TOKEN, WEBAPP_URL, DATABASE_URL)"
         )
+    elif sys.argv[1:] == ["migrate"]:
+        asyncio.run(run_migrate())
     else:
         main()
@@ -0,0 +1,173 @@
+import ast
+import builtins
+import hashlib
+import io
+import keyword
+import re
+import textwrap
+import tokenize
+from typing import FrozenSet, List, Optional
+
+
+ENGINE_VERSION = 1
+KGRAM_SIZE = 5
+WINNOW_WINDOW = 4
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+_FALLBACK_TOKEN_RE = re.compile(r"[A-Za-z_]\w*|\d+(?:\.\d+)?|\S")
+
+
+class _Normalizer(ast.NodeTransformer):
+    """
+    Приводит AST к каноническому виду: пользовательские идентификаторы
+    заменяются на обезличенные имена по роли (функция, класс, переменная),
+    докстринги и строковые литералы отбрасываются. Имена встроенных функций и
+    атрибутов сохраняются, так как они несут смысл алгоритма.
+    """
+
+    def _rename(self, name: str, placeholder: str = "v") -> str:
+        if name in BUILTIN_NAMES:
+            return name
+        return placeholder
+
+    def _strip_docstring(self, node):
+        body = getattr(node, "body", None)
+        if (
+            body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            node.body = body[1:] or [ast.Pass()]
+
+    def visit_Module(self, node):
+        self._strip_docstring(node)
+        return self.generic_visit(node)
+
+    def visit_FunctionDef(self, node):
+        self._strip_docstring(node)
+        node.name = self._rename(node.name, "f")
+        return self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._strip_docstring(node)
+        node.name = self._rename(node.name, "c")
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        node.id = self._rename(node.id)
+        return node
+
+    def visit_arg(self, node):
+        node.arg = self._rename(node.arg)
+        node.annotation = None
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str):
+            node.value = ""
+        return node
+
+
+def parse_source(code: str) -> Optional[ast.Module]:
+    """Разбирает код, допуская общий отступ у всех строк. None при ошибке."""
+    try:
+        return ast.parse(textwrap.dedent(code or ""))
+    except (SyntaxError, ValueError):
+        return None
+
+
+def canonical_source(code: str) -> str:
+    """
+    Канонический вид кода без комментариев и форматирования, но с исходными
+    именами. Для неразбираемого кода — строки без пробелов по краям.
+    """
+    tree = parse_source(code)
+    if tree is None:
+        lines = (line.strip() for line in (code or "").splitlines())
+        return "\n".join(line for line in lines if line)
+    return ast.unparse(tree)
+
+
+def normalize_tokens(code: str) -> List[str]:
+    """Возвращает поток токенов нормализованного кода."""
+    tree = parse_source(code)
+    if tree is None:
+        return _fallback_tokens(code or "")
+
+    tree = _Normalizer().visit(tree)
+    source = ast.unparse(ast.fix_missing_locations(tree))
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+        if tok.type in (tokenize.INDENT, tokenize.DEDENT):
+            tokens.append(tokenize.tok_name[tok.type])
+        elif tok.type in (tokenize.NAME, tokenize.OP, tokenize.NUMBER, tokenize.STRING):
+            tokens.append(tok.string)
+    return tokens
+
+
+def _fallback_tokens(code: str) -> List[str]:
+    tokens = []
+    for token in _FALLBACK_TOKEN_RE.findall(code):
+        if token[0].isalpha() or token[0] == "_":
+            if not keyword.iskeyword(token) and token not in BUILTIN_NAMES:
+                token = "v"
+        tokens.append(token)
+    return tokens
+
+
+def _hash_kgram(tokens: List[str]) -> int:
+    digest = hashlib.blake2b(
+        "\x00".join(tokens).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def fingerprint(code: str) -> FrozenSet[int]:
+    """
+    Строит отпечаток кода методом winnowing по k-граммам нормализованных
+    токенов. Хеши стабильны между процессами, поэтому отпечаток можно хранить.
+    """
+    tokens = normalize_tokens(code)
+    if not tokens:
+        return frozenset()
+    if len(tokens) < KGRAM_SIZE:
+        return frozenset([_hash_kgram(tokens)])
+
+    hashes = [
+        _hash_kgram(tokens[i : i + KGRAM_SIZE])
+        for i in range(len(tokens) - KGRAM_SIZE + 1)
+    ]
+    if len(hashes) <= WINNOW_WINDOW:
+        return frozenset([min(hashes)])
+
+    selected = set()
+    for i in range(len(hashes) - WINNOW_WINDOW + 1):
+        window = hashes[i : i + WINNOW_WINDOW]
+        smallest = min(window)
+        position = max(j for j, value in enumerate(window) if value == smallest)
+        selected.add((i + position, smallest))
+    return frozenset(value for _, value in selected)
+
+
+def fingerprint_similarity(
+    first: FrozenSet[int], second: FrozenSet[int]
+) -> Optional[float]:
+    """
+    Коэффициент Жаккара двух отпечатков, от 0.0 до 1.0. None, если отпечаток
+    шаблона (first) пуст, например у задания нет эталонного решения:
+    сравнивать не с чем, и оригинальность не оценивается.
+    """
+    if not first:
+        return None
+    if not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def structural_similarity(source_code: str, code_to_compare: str) -> Optional[float]:
+    """Структурное сходство двух фрагментов кода на Python."""
+    return fingerprint_similarity(fingerprint(source_code), fingerprint(code_to_compare))
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from models.evaluation_job.evaluation_job import EvaluationJobRecord
+from models.processed_update.processed_update import ProcessedUpdate
+from models.rate_limit.rate_limit import RateLimit
+
+
+logger = logging.getLogger(__name__)
+
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 1))
+# Общее для процессов состояние в PostgreSQL: дедупликация обновлений, лимиты
+# частоты и статусы проверок. По умолчанию включается вместе с несколькими
+# воркерами; SHARED_STATE=1 нужен и при нескольких хостах по одному воркеру.
+SHARED_STATE = os.getenv("SHARED_STATE", "1" if WEB_WORKERS > 1 else "0") == "1"
+LEADER_LOCK_ID = int(os.getenv("LEADER_LOCK_ID", 7260514))
+MIGRATION_LOCK_ID = LEADER_LOCK_ID + 1
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", 10))
+SHARED_STATE_CLEANUP_INTERVAL = float(os.getenv("SHARED_STATE_CLEANUP_INTERVAL", 600))
+PROCESSED_UPDATES_TTL = float(os.getenv("PROCESSED_UPDATES_TTL", 86400))
+STORED_JOB_POLL_INTERVAL = float(os.getenv("STORED_JOB_POLL_INTERVAL", 1))
+
+# GCRA: хранится теоретическое время следующего запроса (tat). Запрос
+# пропускается, если tat опережает текущее время не больше чем на
+# (burst - 1) интервалов; отклонённый запрос tat не меняет. Возвращает,
+# пропущен ли запрос и на сколько секунд tat опережает время.
+TAKE_RATE_TOKEN = text(
+    """
+    WITH taken AS (
+        INSERT INTO rate_limits AS r (key, tat)
+        VALUES (:key, clock_timestamp() + make_interval(secs => :interval))
+        ON CONFLICT (key) DO UPDATE
+            SET tat = GREATEST(r.tat, clock_timestamp()) + make_interval(secs => :interval)
+            WHERE r.tat - clock_timestamp() <= make_interval(secs => :tolerance)
+        RETURNING 1
+    )
+    SELECT EXISTS (SELECT 1 FROM taken) AS allowed,
+           (SELECT EXTRACT(EPOCH FROM tat - clock_timestamp())
+            FROM rate_limits WHERE key = :key) AS ahead
+    """
+)
+
+TERMINAL_STATUSES = ("done", "failed", "timeout")
+
+
+class LeaderElection:
+    """
+    Выбор ведущего воркера через advisory lock PostgreSQL на выделенном
+    соединении. Ведущий отвечает за однократные задачи: регистрацию вебхука,
+    сверку статистики, очистку общего состояния. Если соединение ведущего
+    оборвалось, блокировка снимается и её забирает другой воркер.
+    Без PostgreSQL процесс считается единственным и сразу становится ведущим.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        lock_id: int = LEADER_LOCK_ID,
+        retry_interval: float = LEADER_RETRY_INTERVAL,
+    ):
+        self.engine = engine
+        self.lock_id = lock_id
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._task = None
+
+    async def start(self, on_elected: Callable[[], Awaitable[None]]):
+        self._task = asyncio.create_task(self._run(on_elected))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.is_leader = False
+
+    async def _elected(self, on_elected):
+        self.is_leader = True
+        logger.info(f"Process {os.getpid()} is the leader")
+        try:
+            await on_elected()
+        except Exception as e:
+            logger.error(f"Leader start-up failed: {e}", exc_info=True)
+
+    async def _run(self, on_elected):
+        if self.engine.dialect.name != "postgresql":
+            await self._elected(on_elected)
+            return
+
+        while True:
+            try:
+                async with self.engine.connect() as conn:
+                    try:
+                        await self._hold(conn, on_elected)
+                    except BaseException:
+                        # Закрываем соединение, чтобы блокировка не вернулась в пул.
+                        await conn.invalidate()
+                        raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Leader lock connection failed: {e}")
+            finally:
+                self.is_leader = False
+            await asyncio.sleep(self.retry_interval)
+
+    async def _hold(self, conn, on_elected):
+        while True:
+            acquired = (
+                await conn.execute(
+                    text("SELECT pg_try_advisory_lock(:id)"), {"id": self.lock_id}
+                )
+            ).scalar()
+            await conn.commit()
+            if acquired:
+                break
+            await asyncio.sleep(self.retry_interval)
+
+        await self._elected(on_elected)
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            await conn.execute(text("SELECT 1"))
+            await conn.commit()
+
+
+class StoredJob:
+    """
+    Проверка, которую выполняет другой воркер: статус читается из
+    evaluation_jobs. Интерфейс совпадает с EvaluationJob в части
+    to_dict и follow.
+    """
+
+    def __init__(self, shared: "SharedState", record: EvaluationJobRecord):
+        self.shared = shared
+        self.id = record.id
+        self._apply(record)
+
+    def _apply(self, record: EvaluationJobRecord):
+        self.status = record.status
+        self.result = record.result
+        self.error = record.error
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self):
+        data = {"job_id": self.id, "status": self.status}
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+    async def follow(
+        self, after: int = 0, keepalive: Optional[float] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Опрашивает БД до завершения и отдаёт одно итоговое событие."""
+        idle_since = time.monotonic()
+        while not self.finished:
+            await asyncio.sleep(STORED_JOB_POLL_INTERVAL)
+            record = await self.shared.load_job_record(self.id)
+            if record is None:
+                self.status, self.error = "failed", "Evaluation lost"
+                break
+            self._apply(record)
+            if keepalive is not None and time.monotonic() - idle_since >= keepalive:
+                idle_since = time.monotonic()
+                yield None
+
+        if self.status == "done":
+            yield {"id": after + 1, "event": "result", "data": self.result or {}}
+        else:
+            yield {
+                "id": after + 1,
+                "event": "error",
+                "data": {"status": self.status, "error": self.error},
+            }
+
+
+class SharedState:
+    """
+    Состояние, общее для воркеров и хостов, в PostgreSQL: принятые
+    обновления Telegram, лимиты частоты и статусы проверок. Работает,
+    только если включён SHARED_STATE и база — PostgreSQL.
+    """
+
+    def __init__(self, engine: AsyncEngine, session_factory: async_sessionmaker):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.enabled = SHARED_STATE and engine.dialect.name == "postgresql"
+
+    async def claim_update(self, update_id: int) -> bool:
+        """Запоминает update_id. False, если его уже принял другой воркер."""
+        async with self.session_factory() as session:
+            claimed = (
+                await session.execute(
+                    insert(ProcessedUpdate)
+                    .values(update_id=update_id, received_at=datetime.utcnow())
+                    .on_conflict_do_nothing()
+                    .returning(ProcessedUpdate.update_id)
+                )
+            ).first()
+            await session.commit()
+        return claimed is not None
+
+    async def release_update(self, update_id: int):
+        """Снимает отметку, если обновление не удалось принять, — Telegram его повторит."""
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(ProcessedUpdate).where(ProcessedUpdate.update_id == update_id)
+            )
+            await session.commit()
+
+    async def take_rate_token(self, key: str, rate_per_minute: float, burst: float) -> float:
+        """Общий для воркеров лимит. Возвращает 0 или сколько секунд ждать."""
+        interval = 60 / rate_per_minute
+        tolerance = (max(burst, 1) - 1) * interval
+        async with self.engine.begin() as conn:
+            row = (
+                await conn.execute(
+                    TAKE_RATE_TOKEN,
+                    {"key": key, "interval": interval, "tolerance": tolerance},
+                )
+            ).one()
+        if row.allowed:
+            return 0.0
+        return max(float(row.ahead or 0) - tolerance, 0.001)
+
+    async def save_job(self, job):
+        async with self.session_factory() as session:
+            values = {
+                "status": job.status,
+                "result": job.result,
+                "error": job.error,
+                "updated_at": datetime.utcnow(),
+            }
+            # Запись «queued» из обработчика может закоммититься после итоговой
+            # записи воркера; завершённую проверку она не перезаписывает.
+            await session.execute(
+                insert(EvaluationJobRecord)
+                .values(id=job.id, **values)
+                .on_conflict_do_update(
+                    index_elements=["id"],
+                    set_=values,
+                    where=EvaluationJobRecord.status.notin_(TERMINAL_STATUSES),
+                )
+            )
+            await session.commit()
+
+    async def load_job_record(self, job_id: str) -> Optional[EvaluationJobRecord]:
+        async with self.session_factory() as session:
+            return await session.get(EvaluationJobRecord, job_id)
+
+    async def load_job(self, job_id: str) -> Optional[StoredJob]:
+        record = await self.load_job_record(job_id)
+        return StoredJob(self, record) if record is not None else None
+
+    async def cleanup(self, job_ttl: float):
+        """Удаляет устаревшие записи; выполняет ведущий воркер."""
+        now = datetime.utcnow()
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(ProcessedUpdate).where(
+                    ProcessedUpdate.received_at
+                    < now - timedelta(seconds=PROCESSED_UPDATES_TTL)
+                )
+            )
+            # Истёкший tat означает полный бакет — строка больше не нужна.
+            await session.execute(
+                delete(RateLimit).where(RateLimit.tat < text("clock_timestamp()"))
+            )
+            await session.execute(
+                delete(EvaluationJobRecord).where(
+                    EvaluationJobRecord.updated_at < now - timedelta(seconds=job_ttl)
+                )
+            )
+            await session.commit()
+
+
+async def lock_migrations(conn):
+    """Транзакционная блокировка: миграции с разных хостов не идут одновременно."""
+    if conn.dialect.name == "postgresql":
+        await conn.execute(
+            text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID}
+        )
@@ -0,0 +1,125 @@
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from metrics import DB_POOL_WAIT, instrument_engine
+
+
+logger = logging.getLogger(__name__)
+
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# 0 отключает кэш подготовленных запросов (нужно за pgbouncer в режиме transaction).
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет время ожидания свободного соединения."""
+
+    label = "primary"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            DB_POOL_WAIT.labels(self.label).observe(waited)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.label = self.label
+        return pool
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return {"url": parsed}
+
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if parsed.get_driver_name() == "asyncpg":
+        parsed = parsed.update_query_dict(
+            {"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)}
+        )
+        options["connect_args"] = {"statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    options["url"] = parsed
+    return options
+
+
+def create_engine_from_url(url: str, label: str):
+    options = _engine_options(url)
+    engine = create_async_engine(options.pop("url"), **options)
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.label = label
+    instrument_engine(engine, label)
+    return engine
+
+
+engine = create_engine_from_url(DATABASE_URL, "primary")
+read_engine = (
+    create_engine_from_url(DATABASE_REPLICA_URL, "replica")
+    if DATABASE_REPLICA_URL
+    else engine
+)
+
+async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+# Сессии только для чтения: реплика, если задан DATABASE_REPLICA_URL.
+async_read_session = async_sessionmaker(
+    read_engine, expire_on_commit=False, class_=AsyncSession
+)
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Состояние пулов и время ожидания соединения по каждому движку."""
+    stats = {}
+    engines = [engine] if read_engine is engine else [engine, read_engine]
+    for current in engines:
+        pool = current.pool
+        if not isinstance(pool, TimedQueuePool):
+            continue
+        stats[pool.label] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": pool.checkouts,
+            "wait_avg_ms": round(pool.wait_total / pool.checkouts * 1000, 3)
+            if pool.checkouts
+            else 0.0,
+            "wait_max_ms": round(pool.wait_max * 1000, 3),
+        }
+    return stats
+
+
+async def dispose_engines():
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
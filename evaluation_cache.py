@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from code_similarity import canonical_source
+from models.evaluation_cache.evaluation_cache import EvaluationCacheEntry
+
+
+logger = logging.getLogger(__name__)
+
+
+EVAL_CACHE_SIZE = int(os.getenv("EVAL_CACHE_SIZE", 5000))
+EVAL_CACHE_TTL = float(os.getenv("EVAL_CACHE_TTL", 24 * 3600))
+EVAL_CACHE_DB = os.getenv("EVAL_CACHE_DB", "0") == "1"
+
+UNSTABLE_VERDICTS = ("timeout", "memory_limit", "error")
+
+_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+
+def cache_key(task_id: int, code: str) -> str:
+    """Ключ кэша: id задания и хеш AST-нормализованного решения."""
+    digest = hashlib.sha256(canonical_source(code).encode("utf-8")).hexdigest()
+    return f"{task_id}:{digest}"
+
+
+def _remember(key: str, report: Dict[str, Any], expires_at: float):
+    _cache[key] = (expires_at, report)
+    _cache.move_to_end(key)
+    while len(_cache) > EVAL_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _is_cacheable(report: Dict[str, Any]) -> bool:
+    """
+    Отчёты с ошибками оценки (нулевые оценки) не кэшируются. Не кэшируются и
+    вердикты песочницы, зависящие от нагрузки на хост (таймаут, память), и
+    её ошибки: повторная отправка того же решения должна проверяться заново.
+    """
+    tests = report.get("tests")
+    if isinstance(tests, dict) and tests.get("verdict") in UNSTABLE_VERDICTS:
+        return False
+    return all(
+        item.get("grade", 0) > 0
+        for item in report.values()
+        if isinstance(item, dict) and "grade" in item
+    )
+
+
+async def get_cached_report(
+    session: AsyncSession, task_id: int, code: str
+) -> Optional[Dict[str, Any]]:
+    key = cache_key(task_id, code)
+
+    entry = _cache.get(key)
+    if entry is not None:
+        expires_at, report = entry
+        if expires_at > time.monotonic():
+            _cache.move_to_end(key)
+            stats["memory_hits"] += 1
+            return report
+        del _cache[key]
+
+    if EVAL_CACHE_DB:
+        row = (
+            await session.execute(
+                select(
+                    EvaluationCacheEntry.report, EvaluationCacheEntry.created_at
+                ).where(
+                    EvaluationCacheEntry.cache_key == key,
+                    EvaluationCacheEntry.created_at
+                    > datetime.utcnow() - timedelta(seconds=EVAL_CACHE_TTL),
+                )
+            )
+        ).first()
+        if row is not None:
+            age = (datetime.utcnow() - row.created_at).total_seconds()
+            _remember(key, row.report, time.monotonic() + EVAL_CACHE_TTL - age)
+            stats["db_hits"] += 1
+            return row.report
+
+    stats["misses"] += 1
+    return None
+
+
+async def store_report(
+    session: AsyncSession, task_id: int, code: str, report: Dict[str, Any]
+):
+    """Сохраняет отчёт в кэш. При включённом EVAL_CACHE_DB фиксирует транзакцию."""
+    if not _is_cacheable(report):
+        return
+
+    key = cache_key(task_id, code)
+    _remember(key, report, time.monotonic() + EVAL_CACHE_TTL)
+    stats["stores"] += 1
+
+    if EVAL_CACHE_DB:
+        statement = insert(EvaluationCacheEntry).values(
+            cache_key=key,
+            task_id=task_id,
+            report=report,
+            created_at=datetime.utcnow(),
+        )
+        await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["cache_key"],
+                set_={
+                    "report": statement.excluded.report,
+                    "created_at": statement.excluded.created_at,
+                },
+            )
+        )
+        await session.commit()
+
+
+def cache_stats() -> Dict[str, Any]:
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    hits = stats["memory_hits"] + stats["db_hits"]
+    return {
+        **stats,
+        "size": len(_cache),
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from metrics import EVALUATION_STAGE_DURATION
+
+
+logger = logging.getLogger(__name__)
+
+
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", 4))
+EVAL_QUEUE_SIZE = int(os.getenv("EVAL_QUEUE_SIZE", 100))
+EVAL_JOB_TIMEOUT = float(os.getenv("EVAL_JOB_TIMEOUT", 60))
+EVAL_RESULT_TTL = float(os.getenv("EVAL_RESULT_TTL", 600))
+
+
+class QueueFullError(Exception):
+    """Очередь проверок переполнена."""
+
+
+Progress = Callable[[str, Dict[str, Any]], None]
+
+
+class EvaluationJob:
+    def __init__(
+        self, job_id: str, run: Callable[[Progress], Awaitable[Dict[str, Any]]]
+    ):
+        self.id = job_id
+        self.run = run
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self._updated = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: str, data: Optional[Dict[str, Any]] = None):
+        """Добавляет событие хода проверки и будит подписчиков."""
+        self.events.append({"id": len(self.events) + 1, "event": event, "data": data or {}})
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def follow(
+        self, after: int = 0, keepalive: Optional[float] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        События с id больше after по мере появления; заканчивается после
+        итогового события. Если за keepalive секунд ничего не произошло,
+        отдаёт None, чтобы поток мог отправить keep-alive.
+        """
+        while True:
+            while after < len(self.events):
+                after += 1
+                yield self.events[after - 1]
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(self._updated.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    def to_dict(self):
+        data = {"job_id": self.id, "status": self.status}
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class EvaluationQueue:
+    """
+    Ограниченная очередь проверок решений с фиксированным пулом воркеров.
+    Обработчик запроса только ставит задачу в очередь и сразу возвращает её id,
+    а результат забирается отдельным запросом статуса или потоком событий
+    задачи (EvaluationJob.follow).
+    """
+
+    def __init__(
+        self,
+        workers: int = EVAL_WORKERS,
+        max_size: int = EVAL_QUEUE_SIZE,
+        job_timeout: float = EVAL_JOB_TIMEOUT,
+        result_ttl: float = EVAL_RESULT_TTL,
+        on_finish: Optional[Callable[[EvaluationJob], Awaitable[None]]] = None,
+    ):
+        self.on_finish = on_finish
+        self.workers = workers
+        self.max_size = max_size
+        self.job_timeout = job_timeout
+        self.result_ttl = result_ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: Dict[str, EvaluationJob] = {}
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+        logger.info(
+            f"Evaluation queue started: {self.workers} workers, "
+            f"max {self.max_size} jobs, timeout {self.job_timeout}s"
+        )
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(
+        self, run: Callable[[Progress], Awaitable[Dict[str, Any]]]
+    ) -> EvaluationJob:
+        """
+        Ставит проверку в очередь. run получает функцию publish(event, data)
+        для промежуточных событий. Бросает QueueFullError, если мест нет.
+        """
+        self._purge_expired()
+        job = EvaluationJob(uuid.uuid4().hex, run)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Evaluation queue is full")
+        self._jobs[job.id] = job
+        job.publish("queued", {"job_id": job.id, "position": self._queue.qsize()})
+        return job
+
+    def get(self, job_id: str) -> Optional[EvaluationJob]:
+        return self._jobs.get(job_id)
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            EVALUATION_STAGE_DURATION.labels("queue_wait").observe(
+                time.monotonic() - job.created_at
+            )
+            job.publish("started")
+            try:
+                job.result = await asyncio.wait_for(
+                    job.run(job.publish), self.job_timeout
+                )
+                job.status = "done"
+            except asyncio.TimeoutError:
+                logger.warning(f"Evaluation job {job.id} timed out")
+                job.status = "timeout"
+                job.error = "Evaluation timed out"
+            except Exception as e:
+                logger.error(f"Evaluation job {job.id} failed: {e}", exc_info=True)
+                job.status = "failed"
+                job.error = "Evaluation failed"
+            finally:
+                job.finished_at = time.monotonic()
+                if job.status == "done":
+                    job.publish("result", job.result)
+                else:
+                    job.publish("error", {"status": job.status, "error": job.error})
+                self._queue.task_done()
+            if self.on_finish is not None:
+                try:
+                    await self.on_finish(job)
+                except Exception as e:
+                    logger.error(f"Evaluation job {job.id} on_finish failed: {e}")
@@ -0,0 +1,79 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import FrozenSet
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from code_similarity import ENGINE_VERSION, fingerprint
+from models.task_fingerprint.task_fingerprint import TaskFingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+FINGERPRINT_CACHE_SIZE = int(os.getenv("FINGERPRINT_CACHE_SIZE", 1024))
+
+_cache: "OrderedDict[str, FrozenSet[int]]" = OrderedDict()
+
+
+def template_hash(code: str) -> str:
+    """Хеш содержимого эталонного решения с учётом версии движка сходства."""
+    return hashlib.sha256(f"{ENGINE_VERSION}:{code}".encode("utf-8")).hexdigest()
+
+
+def _remember(content_hash: str, value: FrozenSet[int]):
+    _cache[content_hash] = value
+    _cache.move_to_end(content_hash)
+    while len(_cache) > FINGERPRINT_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def store_template_fingerprint(
+    session: AsyncSession, code: str
+) -> FrozenSet[int]:
+    """
+    Вычисляет отпечаток эталонного решения и добавляет его в транзакцию сессии.
+    Вызывается при создании задания, до commit.
+    """
+    content_hash = template_hash(code)
+    value = fingerprint(code)
+    await session.execute(
+        insert(TaskFingerprint)
+        .values(content_hash=content_hash, fingerprint=sorted(value))
+        .on_conflict_do_nothing(index_elements=["content_hash"])
+    )
+    _remember(content_hash, value)
+    return value
+
+
+async def get_template_fingerprint(
+    session: AsyncSession, code: str
+) -> FrozenSet[int]:
+    """
+    Возвращает отпечаток эталонного решения: из LRU-кэша, затем из таблицы
+    task_fingerprints. Если его ещё нет, вычисляет и сохраняет (с commit).
+    """
+    content_hash = template_hash(code)
+    cached = _cache.get(content_hash)
+    if cached is not None:
+        _cache.move_to_end(content_hash)
+        return cached
+
+    stored = await session.scalar(
+        select(TaskFingerprint.fingerprint).where(
+            TaskFingerprint.content_hash == content_hash
+        )
+    )
+    if stored is not None:
+        value = frozenset(stored)
+        _remember(content_hash, value)
+        return value
+
+    value = await store_template_fingerprint(session, code)
+    await session.commit()
+    logger.info(f"Template fingerprint {content_hash[:12]} stored")
+    return value
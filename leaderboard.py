@@ -0,0 +1,179 @@
+import random
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * level
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """
+    Упорядоченный набор ключей на основе skip list с ширинами ссылок:
+    вставка, удаление и подсчёт позиции ключа за O(log n) в среднем.
+    """
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _find(self, key):
+        update = [self._head] * MAX_LEVEL
+        steps = [0] * MAX_LEVEL
+        node, position = self._head, 0
+        for i in reversed(range(MAX_LEVEL)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            update[i] = node
+            steps[i] = position
+        return update, steps
+
+    def insert(self, key):
+        update, steps = self._find(key)
+        level = self._random_level()
+        new = _Node(key, level)
+        for i in range(level):
+            prev = update[i]
+            new.next[i] = prev.next[i]
+            prev.next[i] = new
+            new.width[i] = prev.width[i] - (steps[0] - steps[i])
+            prev.width[i] = steps[0] - steps[i] + 1
+        for i in range(level, MAX_LEVEL):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, key) -> bool:
+        update, _ = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(MAX_LEVEL):
+            if update[i].next[i] is node:
+                update[i].width[i] += node.width[i] - 1
+                update[i].next[i] = node.next[i]
+            else:
+                update[i].width[i] -= 1
+        self._size -= 1
+        return True
+
+    def count_less(self, key) -> int:
+        """Количество ключей, строго меньших key."""
+        _, steps = self._find(key)
+        return steps[0]
+
+    def first(self, n: int) -> Iterable[Any]:
+        node = self._head.next[0]
+        while node is not None and n > 0:
+            yield node.key
+            node = node.next[0]
+            n -= 1
+
+
+class Leaderboard:
+    """
+    Рейтинг пользователей по баллам. Ключ в skip list — (-points, user_id),
+    поэтому начало списка — лидеры. Место пользователя — 1 + число
+    пользователей со строго большим количеством баллов.
+    """
+
+    def __init__(self):
+        self._entries = IndexableSkipList()
+        self._points: Dict[int, int] = {}
+        self._names: Dict[int, str] = {}
+        self._pending: List[List[Tuple[int, int, Optional[str]]]] = []
+        self.ready = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def begin_rebuild(self) -> List[Tuple[int, int, Optional[str]]]:
+        """
+        Начинает перестроение, строки для которого ещё читаются из БД.
+        Обновления до вызова rebuild применяются к текущему рейтингу и копятся
+        в возвращённом буфере, чтобы переиграть их поверх новых строк.
+        """
+        pending = []
+        self._pending.append(pending)
+        return pending
+
+    def abort_rebuild(self, pending: List[Tuple[int, int, Optional[str]]]):
+        self._pending = [buffer for buffer in self._pending if buffer is not pending]
+
+    def rebuild(
+        self,
+        rows: Iterable[Tuple[int, str, int]],
+        pending: Optional[List[Tuple[int, int, Optional[str]]]] = None,
+    ):
+        """
+        Перестраивает рейтинг по строкам (user_id, username, points) и
+        переигрывает поверх них обновления из буфера begin_rebuild.
+        """
+        if pending is not None:
+            self.abort_rebuild(pending)
+        self._entries = IndexableSkipList()
+        self._points = {}
+        self._names = {}
+        for user_id, username, points in rows:
+            self._apply(user_id, points or 0, username)
+        for user_id, points, username in pending or ():
+            self._apply(user_id, points, username)
+        self.ready = True
+
+    def update(self, user_id: int, points: int, username: Optional[str] = None):
+        for pending in self._pending:
+            pending.append((user_id, points, username))
+        self._apply(user_id, points, username)
+
+    def _apply(self, user_id: int, points: int, username: Optional[str]):
+        if username is not None:
+            self._names[user_id] = username
+        old_points = self._points.get(user_id)
+        if old_points == points:
+            return
+        if old_points is not None:
+            self._entries.remove((-old_points, user_id))
+        self._entries.insert((-points, user_id))
+        self._points[user_id] = points
+
+    def rank(self, user_id: int) -> Optional[int]:
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return self._entries.count_less((-points, float("-inf"))) + 1
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        result = []
+        previous_points, rank = None, 0
+        for position, (negative_points, user_id) in enumerate(
+            self._entries.first(n), start=1
+        ):
+            if -negative_points != previous_points:
+                rank = position
+                previous_points = -negative_points
+            result.append(
+                {
+                    "rank": rank,
+                    "user_id": user_id,
+                    "username": self._names.get(user_id),
+                    "points": -negative_points,
+                }
+            )
+        return result
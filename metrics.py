@@ -0,0 +1,197 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from aiohttp import web
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily
+from sqlalchemy import event
+
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60)
+
+DB_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route"],
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP-запросы по статусу ответа", ["method", "route", "status"]
+)
+EVALUATION_STAGE_DURATION = Histogram(
+    "evaluation_stage_duration_seconds",
+    "Время стадий проверки решения",
+    ["stage"],
+    buckets=SLOW_BUCKETS,
+)
+EVALUATION_STAGE_TIMEOUTS = Counter(
+    "evaluation_stage_timeouts_total", "Стадии проверки, превысившие дедлайн", ["stage"]
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Время запроса к LLM",
+    ["backend"],
+    buckets=SLOW_BUCKETS,
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total", "Ошибки LLM: error, timeout, invalid_response", ["kind"]
+)
+EVALUATION_GATES = Counter(
+    "evaluation_gate_results_total",
+    "Результаты локальных проверок решения: passed, rejected, skipped",
+    ["stage", "outcome"],
+)
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Решения контроля нагрузки: accepted или причина отказа",
+    ["endpoint", "outcome"],
+)
+SANDBOX_VERDICTS = Counter(
+    "sandbox_verdicts_total", "Результаты прогона решений по скрытым тестам", ["verdict"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL-запроса",
+    ["engine", "operation"],
+    buckets=FAST_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Ошибки SQL-запросов", ["engine"])
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Ожидание свободного соединения в пуле",
+    ["engine"],
+    buckets=FAST_BUCKETS,
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        EVALUATION_STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+
+
+def register_gauge(name: str, documentation: str, read: Callable[[], float]):
+    """Gauge, значение которого читается функцией в момент сбора метрик."""
+    Gauge(name, documentation).set_function(read)
+
+
+class _StatsCollector:
+    def __init__(self, name: str, documentation: str, label: str, read):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.read = read
+
+    def collect(self):
+        family = CounterMetricFamily(self.name, self.documentation, labels=[self.label])
+        for key, value in self.read().items():
+            family.add_metric([key], value)
+        yield family
+
+
+def register_counters(
+    name: str, documentation: str, label: str, read: Callable[[], Dict[str, float]]
+):
+    """Счётчики из словаря статистики модуля (ключ словаря — значение метки)."""
+    REGISTRY.register(_StatsCollector(name, documentation, label, read))
+
+
+def instrument_engine(engine, label: str):
+    """Замеряет время SQL-запросов движка через события SQLAlchemy."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip()[:6].upper()
+        if operation not in DB_OPERATIONS:
+            operation = "WITH" if operation.startswith("WITH") else "OTHER"
+        DB_QUERY_DURATION.labels(label, operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        connection = context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+        DB_QUERY_ERRORS.labels(label).inc()
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler):
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    status = 500
+    started = time.perf_counter()
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_REQUEST_DURATION.labels(request.method, route).observe(
+            time.perf_counter() - started
+        )
+        HTTP_REQUESTS.labels(request.method, route, str(status)).inc()
+
+
+class _WorkerLabelled:
+    """Реестр метрик процесса, где к каждой серии добавлена метка worker."""
+
+    def __init__(self, worker: str):
+        self.worker = worker
+
+    def collect(self):
+        for family in REGISTRY.collect():
+            family.samples = [
+                sample._replace(labels={**sample.labels, "worker": self.worker})
+                for sample in family.samples
+            ]
+            yield family
+
+
+_exposed = REGISTRY
+
+
+def label_worker(worker: int):
+    """
+    Несколько воркеров: метрики каждого процесса помечаются его номером,
+    чтобы серии разных воркеров не смешивались при сборе.
+    """
+    global _exposed
+    _exposed = _WorkerLabelled(str(worker))
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=generate_latest(_exposed), headers={"Content-Type": CONTENT_TYPE_LATEST}
+    )
+
+
+async def start_metrics_server(port: int) -> web.AppRunner:
+    """Отдельный порт с /metrics одного воркера: общий порт отвечает любым из них."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
@@ -0,0 +1,13 @@
+from sqlalchemy import String, DateTime, Integer, JSON
+from sqlalchemy.orm import Mapped, mapped_column
+from ..base_model import Base
+from datetime import datetime
+
+
+class EvaluationCacheEntry(Base):
+    __tablename__ = "evaluation_cache"
+
+    cache_key: Mapped[str] = mapped_column(String(96), primary_key=True)
+    task_id: Mapped[int] = mapped_column(Integer, index=True)
+    report: Mapped[dict] = mapped_column(JSON)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,18 @@
+from sqlalchemy import String, DateTime, JSON
+from sqlalchemy.orm import Mapped, mapped_column
+from ..base_model import Base
+from datetime import datetime
+
+
+class EvaluationJobRecord(Base):
+    """Состояние проверки для запросов статуса, попавших на другой воркер."""
+
+    __tablename__ = "evaluation_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    status: Mapped[str] = mapped_column(String(16))
+    result: Mapped[dict] = mapped_column(JSON, nullable=True)
+    error: Mapped[str] = mapped_column(String(255), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True
+    )
@@ -0,0 +1,15 @@
+from sqlalchemy import BigInteger, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from ..base_model import Base
+from datetime import datetime
+
+
+class ProcessedUpdate(Base):
+    """update_id обновлений Telegram, принятых одним из воркеров."""
+
+    __tablename__ = "processed_updates"
+
+    update_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    received_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, index=True
+    )
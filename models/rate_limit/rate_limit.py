@@ -0,0 +1,13 @@
+from sqlalchemy import String, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from ..base_model import Base
+from datetime import datetime
+
+
+class RateLimit(Base):
+    """Общий для воркеров лимит частоты (GCRA): теоретическое время следующего запроса."""
+
+    __tablename__ = "rate_limits"
+
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    tat: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
@@ -1,7 +1,8 @@
 
-from sqlalchemy import String, Integer
+from sqlalchemy import String, Integer, JSON
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from ..base_model import Base
+import asyncio
 import logging
 import json
 import re 
@@ -16,26 +17,34 @@ class Task(Base):
     inference: Mapped[str] = mapped_column(
         String(5000), nullable=True
     )  
+    # Функция, которую вызывают скрытые тесты: [{"input": [аргументы], "output": ответ}].
+    entry_point: Mapped[str] = mapped_column(String(100), nullable=True)
+    test_cases: Mapped[list] = mapped_column(JSON, nullable=True)
 
     
     user_completions = relationship("UserTask", back_populates="task")
 
-    def to_dict(self):
+    def to_dict(self, completion_count=None):
+        if completion_count is None:
+            completion_count = len(self.user_completions) if hasattr(self, 'user_completions') and self.user_completions is not None else 0
         base_dict = {
             "id": self.id,
             "title": self.title,
             "description": self.description,
             "difficulty": self.difficulty,
             "points": self.points,
+            "entry_point": self.entry_point,
             
             "created_at": self.created_at.isoformat() if hasattr(self, 'created_at') and self.created_at else None,
             
-            "completion_count": len(self.user_completions) if hasattr(self, 'user_completions') and self.user_completions is not None else 0
+            "completion_count": completion_count
         }
         return base_dict
 
     @staticmethod
-    def create_task(title, description, difficulty, points, inference=None):
+    def create_task(
+        title, description, difficulty, points, inference=None, entry_point=None, test_cases=None
+    ):
         """Метод для создания нового задания"""
         return Task(
             title=title,
@@ -43,19 +52,18 @@ class Task(Base):
             difficulty=difficulty,
             points=points,
             inference=inference,
+            entry_point=entry_point,
+            test_cases=test_cases,
         )
 
     @staticmethod
-    async def generate_task_from_topic(topic):
-        """Генерирует задание на основе темы"""
-        try:
-            from g4f.client import Client
-            from g4f.models import DeepInfraChat
-
-            client = Client()
-            prompt = f"""
+    def build_generation_prompt(topic, difficulty=None):
+        difficulty_hint = (
+            f'Сложность задания должна быть: "{difficulty}".' if difficulty else ""
+        )
+        return f"""
             Сгенерируй учебное задание по программированию на тему: "{topic}"
-            
+            {difficulty_hint}
             Твой ответ ДОЛЖЕН БЫТЬ СТРОГО в формате JSON без каких-либо пояснений, вступлений или markdown-оберток.
             Никогда не используй одинарные кавычки для ключей или строк. Всегда используй двойные кавычки.
             Экранируй все двойные кавычки внутри строковых значений с помощью \\".
@@ -67,46 +75,109 @@ class Task(Base):
                 "difficulty": "Средне",
                 "points": 5, # Количество баллов за выполнение задания всегда 5
                 "inference": "def solution():\\n    
+                "function_name": "solution",
+                "tests": [{{"input": [[3, 1, 2]], "output": [1, 2, 3]}}]
             }}
 
             Вот твой запрос:
             {{
                 "title": "Краткое название задания (не более 100 символов)",
-                "description": "Подробное описание задания (не более 500 символов)",
+                "description": "Подробное описание задания (не более 500 символов), включая имя и аргументы функции, которую нужно написать",
                 "difficulty": "Один из вариантов: 'Легко', 'Средне', 'Сложно'",
                 "points": 5,  
-                "inference": "Полное решение задачи на Python с комментариями"
+                "inference": "Полное решение задачи на Python с комментариями в виде функции function_name",
+                "function_name": "Имя функции решения",
+                "tests": "От 5 до 10 тестов: input — список аргументов функции, output — ожидаемый результат (только JSON-значения)"
             }}
             """
 
-            response = client.chat.completions.create(
-                model="deepseek-prover-v2-671b",
-                messages=[{"role": "user", "content": prompt}],
-                provider=DeepInfraChat,
-            )
-            
-            content = response.choices[0].message.content
-            logging.info(f"Получен ответ от LLM: {content}") 
+    @staticmethod
+    def request_generation(prompt):
+        """Синхронный запрос к LLM. Вызывается вне цикла событий."""
+        from check_code import LLM_API_URL, complete_llm_http
 
-            
-            
-            match = re.search(r'\{.*\}', content, re.DOTALL)
-            if not match:
-                raise json.JSONDecodeError("Не найден JSON объект в ответе LLM", content, 0)
-            
-            json_str = match.group(0)
+        if LLM_API_URL:
+            return complete_llm_http(prompt)
 
-            
-            task_data = json.loads(json_str)
+        from g4f.client import Client
+        from g4f.models import DeepInfraChat
 
-            
-            return Task.create_task(
-                title=task_data.get("title"),
-                description=task_data.get("description"),
-                difficulty=task_data.get("difficulty"),
-                points=task_data.get("points"),
-                inference=task_data.get("inference"),
+        client = Client()
+        response = client.chat.completions.create(
+            model="deepseek-prover-v2-671b",
+            messages=[{"role": "user", "content": prompt}],
+            provider=DeepInfraChat,
+        )
+        return response.choices[0].message.content
+
+    @staticmethod
+    def parse_generated_task(content):
+        match = re.search(r'\{.*\}', content, re.DOTALL)
+        if not match:
+            raise json.JSONDecodeError("Не найден JSON объект в ответе LLM", content, 0)
+
+        json_str = match.group(0)
+
+        task_data = json.loads(json_str)
+
+        return Task.create_task(
+            title=task_data.get("title"),
+            description=task_data.get("description"),
+            difficulty=task_data.get("difficulty"),
+            points=task_data.get("points"),
+            inference=task_data.get("inference"),
+            entry_point=task_data.get("function_name"),
+            test_cases=Task.parse_test_cases(task_data.get("tests")),
+        )
+
+    @staticmethod
+    def parse_test_cases(tests):
+        """Приводит тесты из ответа LLM к виду [{"input": [аргументы], "output": ответ}]."""
+        if not isinstance(tests, list):
+            return None
+        cases = []
+        for case in tests:
+            if not isinstance(case, dict) or "input" not in case or "output" not in case:
+                continue
+            arguments = case["input"]
+            cases.append(
+                {
+                    "input": arguments if isinstance(arguments, list) else [arguments],
+                    "output": case["output"],
+                }
             )
+        return cases or None
+
+    @staticmethod
+    async def generate_task_from_topic(topic, difficulty=None, sandbox=None):
+        """
+        Генерирует задание на основе темы. Если передан пул песочницы,
+        скрытые тесты проверяются эталонным решением: остаются только те,
+        ответ которых совпал с ответом inference.
+        """
+        try:
+            prompt = Task.build_generation_prompt(topic, difficulty)
+            content = await asyncio.to_thread(Task.request_generation, prompt)
+            logging.info(f"Получен ответ от LLM: {content}") 
+
+            task = Task.parse_generated_task(content)
+            tests = task.test_cases
+            task.test_cases = None
+            if tests and task.inference and task.entry_point and sandbox:
+                try:
+                    task.test_cases = (
+                        await sandbox.validate(task.inference, task.entry_point, tests)
+                        or None
+                    )
+                except Exception as e:
+                    logging.warning(f"Не удалось проверить тесты эталоном: {e}")
+                logging.info(
+                    f"Тесты задания '{task.title}': {len(task.test_cases or [])} из {len(tests)} подтверждены эталоном"
+                )
+            if task.test_cases is None:
+                # Имя функции нужно только для скрытых тестов.
+                task.entry_point = None
+            return task
         except Exception as e:
             logging.error(f"Ошибка при генерации задания: {e}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
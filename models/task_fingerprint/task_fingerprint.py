@@ -0,0 +1,12 @@
+from sqlalchemy import String, DateTime, JSON
+from sqlalchemy.orm import Mapped, mapped_column
+from ..base_model import Base
+from datetime import datetime
+
+
+class TaskFingerprint(Base):
+    __tablename__ = "task_fingerprints"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    fingerprint: Mapped[list] = mapped_column(JSON)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
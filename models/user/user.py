@@ -1,5 +1,6 @@
 from ..base_model import Base
-from sqlalchemy import BigInteger, String, DateTime, Integer
+from sqlalchemy import BigInteger, String, DateTime, Integer, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
 
@@ -10,6 +11,14 @@ class User(Base):
     username: Mapped[str] = mapped_column(String)
     registered_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     points: Mapped[int] = mapped_column(Integer, default=0)
+    solved_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    last_solved_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    # Число решённых задач по сложности: {"Легко": 3, "Средне": 1}.
+    solved_by_difficulty: Mapped[dict] = mapped_column(
+        JSON().with_variant(JSONB(), "postgresql"),
+        default=dict,
+        server_default="{}",
+    )
 
     task_completions = relationship("UserTask", back_populates="user")
 
@@ -23,13 +32,9 @@ class User(Base):
             "username": self.username,
             "registered_at": self.registered_at.isoformat(),
             "points": self.points,
-            "completed_tasks": [
-                {
-                    "id": completion.task.id,
-                    "title": completion.task.title,
-                    "earned_points": completion.earned_points,
-                    "completed_at": completion.completed_at.isoformat(),
-                }
-                for completion in self.task_completions
-            ],
+            "solved_count": self.solved_count,
+            "last_solved_at": self.last_solved_at.isoformat()
+            if self.last_solved_at
+            else None,
+            "solved_by_difficulty": self.solved_by_difficulty or {},
         }
@@ -1,4 +1,4 @@
-from sqlalchemy import BigInteger, ForeignKey, DateTime, Integer, Column
+from sqlalchemy import BigInteger, ForeignKey, DateTime, Integer, Column, Index
 from sqlalchemy.orm import relationship, mapped_column
 from ..base_model import Base
 from datetime import datetime
@@ -6,9 +6,13 @@ from datetime import datetime
 
 class UserTask(Base):
     __tablename__ = "user_tasks"
+    __table_args__ = (
+        # История решений пользователя: keyset-пагинация по (completed_at, task_id).
+        Index("ix_user_tasks_user_history", "user_id", "completed_at", "task_id"),
+    )
 
     user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
-    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True, index=True)
     earned_points = Column(Integer, nullable=False)  
     completed_at = Column(DateTime, default=datetime.utcnow)  
 
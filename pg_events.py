@@ -0,0 +1,83 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+
+logger = logging.getLogger(__name__)
+
+
+RECONNECT_DELAY = 5
+
+
+class PgEventBus:
+    """
+    Рассылка событий между процессами через Postgres LISTEN/NOTIFY.
+    Уведомление, отправленное внутри транзакции, доставляется только после
+    её commit, в том числе и самому отправителю, поэтому обработчики должны
+    быть идемпотентными. На других СУБД шина работает только локально.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.enabled = engine.dialect.name == "postgresql"
+        self._handlers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = (
+            defaultdict(list)
+        )
+        self._task = None
+
+    def subscribe(self, channel: str, handler: Callable[[Dict[str, Any]], None]):
+        """Регистрирует обработчик канала. Вызывать до start()."""
+        self._handlers[channel].append(handler)
+
+    async def publish(self, session: AsyncSession, channel: str, payload: Dict[str, Any]):
+        """Добавляет NOTIFY в текущую транзакцию сессии."""
+        if not self.enabled:
+            return
+        await session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": channel, "payload": json.dumps(payload)},
+        )
+
+    async def start(self):
+        if self.enabled and self._handlers:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _dispatch(self, connection, pid, channel, payload):
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            logger.warning(f"Malformed notification on {channel}: {payload!r}")
+            return
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(data)
+            except Exception as e:
+                logger.error(f"Event handler for {channel} failed: {e}", exc_info=True)
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    closed = asyncio.Event()
+                    raw.add_termination_listener(lambda _: closed.set())
+                    for channel in self._handlers:
+                        await raw.add_listener(channel, self._dispatch)
+                    logger.info(f"Listening on channels: {', '.join(self._handlers)}")
+                    await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event listener connection failed: {e}")
+            await asyncio.sleep(RECONNECT_DELAY)
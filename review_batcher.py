@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List
+
+from check_code import (
+    build_batch_review_prompt,
+    complete_llm_async,
+    parse_llm_batch_review_json,
+    review_code_async,
+)
+from metrics import observe_stage
+
+
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", 8))
+REVIEW_BATCH_WINDOW_MS = float(os.getenv("REVIEW_BATCH_WINDOW_MS", 200))
+REVIEW_LATENCY_SAMPLES = 1000
+
+
+class _PendingReview:
+    __slots__ = ("code", "algorithm_name", "future", "enqueued_at")
+
+    def __init__(self, code: str, algorithm_name: str, future: asyncio.Future):
+        self.code = code
+        self.algorithm_name = algorithm_name
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class ReviewBatcher:
+    """
+    Собирает решения на ревью в пакеты (до batch_size штук или window_ms
+    миллисекунд ожидания) и отправляет каждый пакет одним промптом.
+    Решения, оценку которых не удалось извлечь из ответа, проверяются
+    по одному.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = REVIEW_BATCH_SIZE,
+        window_ms: float = REVIEW_BATCH_WINDOW_MS,
+        complete: Callable[[str], Awaitable[str]] = complete_llm_async,
+        review_single: Callable[[str, str], Awaitable[Dict[str, Any]]] = review_code_async,
+    ):
+        self.batch_size = batch_size
+        self.window = window_ms / 1000
+        self.complete = complete
+        self.review_single = review_single
+        self._queue: asyncio.Queue = None
+        self._collector = None
+        self._batches = set()
+        self._latencies = deque(maxlen=REVIEW_LATENCY_SAMPLES)
+        self._counters = {"items": 0, "batches": 0, "fallbacks": 0}
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return dict(self._counters)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        tasks = [self._collector, *self._batches] if self._collector else []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._collector = None
+
+    async def review(self, code: str, algorithm_name: str) -> Dict[str, Any]:
+        """Ставит решение в текущий пакет и ждёт его оценки."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_PendingReview(code, algorithm_name, future))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[_PendingReview]):
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+        self._counters["batches"] += 1
+
+        if len(batch) == 1:
+            await self._resolve(batch[0], None, fallback=False)
+            return
+
+        prompt = build_batch_review_prompt(
+            [(item.code, item.algorithm_name) for item in batch]
+        )
+        review_text = await self.complete(prompt)
+        with observe_stage("parse"):
+            reviews = parse_llm_batch_review_json(review_text, len(batch))
+        await asyncio.gather(
+            *(self._resolve(item, review) for item, review in zip(batch, reviews))
+        )
+
+    async def _resolve(self, item: _PendingReview, review, fallback: bool = True):
+        try:
+            if review is None:
+                if fallback:
+                    self._counters["fallbacks"] += 1
+                review = await self.review_single(item.code, item.algorithm_name)
+            if not item.future.done():
+                item.future.set_result(review)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+        finally:
+            self._counters["items"] += 1
+            self._latencies.append(time.perf_counter() - item.enqueued_at)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(fraction * len(latencies)))
+            return round(latencies[index] * 1000, 1)
+
+        batches = self._counters["batches"]
+        return {
+            **self._counters,
+            "queued": self.depth,
+            "avg_batch_size": round(self._counters["items"] / batches, 2) if batches else 0,
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+            },
+        }
@@ -0,0 +1,452 @@
+import asyncio
+import copy
+import importlib
+import json
+import logging
+import math
+import os
+import select
+import signal
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
+
+SANDBOX_WORKERS = int(
+    os.getenv("SANDBOX_WORKERS", min(4, os.cpu_count() or 1) if resource else 0)
+)
+SANDBOX_CPU_LIMIT = int(os.getenv("SANDBOX_CPU_LIMIT", 2))
+SANDBOX_MEMORY_LIMIT_MB = int(os.getenv("SANDBOX_MEMORY_LIMIT_MB", 256))
+SANDBOX_WALL_LIMIT = float(os.getenv("SANDBOX_WALL_LIMIT", 5))
+SANDBOX_MAX_OUTPUT = 1 << 20
+
+NOBODY_UID = 65534
+WORKER_SCRIPT = os.path.abspath(__file__)
+FRAME_HEADER = 4
+# Потомок не может открыть ни одного дескриптора, поэтому модули для решений
+# загружаются в воркер заранее; остальные импорты в решении не сработают.
+PRELOADED_MODULES = (
+    "array", "bisect", "collections", "copy", "dataclasses", "decimal",
+    "fractions", "functools", "heapq", "itertools", "json", "math",
+    "operator", "random", "re", "statistics", "string", "typing",
+)
+RESULT_FD = 3
+
+
+class SandboxError(Exception):
+    """Пул песочницы недоступен или воркер не ответил."""
+
+
+def normalize_value(value: Any) -> Any:
+    """Приводит результат к JSON-виду: кортежи — списки, множества — отсортированные списки."""
+
+    def default(item):
+        if isinstance(item, (set, frozenset)):
+            return sorted(item, key=repr)
+        return repr(item)
+
+    return json.loads(json.dumps(value, default=default))
+
+
+def values_match(actual: Any, expected: Any) -> bool:
+    if isinstance(expected, float) or isinstance(actual, float):
+        try:
+            return math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-9)
+        except TypeError:
+            return False
+    if isinstance(expected, list) and isinstance(actual, list):
+        return len(actual) == len(expected) and all(
+            values_match(a, e) for a, e in zip(actual, expected)
+        )
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return actual.keys() == expected.keys() and all(
+            values_match(actual[key], expected[key]) for key in expected
+        )
+    return actual == expected
+
+
+def _address_space_in_use() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _isolate_result_fd(fd: int) -> int:
+    """
+    Переставляет канал результата на RESULT_FD и закрывает все остальные
+    унаследованные дескрипторы, в том числе каналы воркера к приложению.
+    """
+    if fd != RESULT_FD:
+        os.dup2(fd, RESULT_FD)
+    os.closerange(0, RESULT_FD)
+    os.closerange(RESULT_FD + 1, os.sysconf("SC_OPEN_MAX"))
+    return RESULT_FD
+
+
+def _apply_limits(cpu_limit: int, memory_limit: int):
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        if fd != devnull:
+            os.dup2(devnull, fd)
+    if devnull > 2:
+        os.close(devnull)
+
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))
+    # Процесс унаследовал адресное пространство воркера, поэтому лимит
+    # отсчитывается от уже занятого объёма.
+    address_space = _address_space_in_use() + memory_limit
+    resource.setrlimit(resource.RLIMIT_AS, (address_space, address_space))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    # Новых дескрипторов не открыть: ни сокетов (сеть), ни файлов, ни модулей
+    # стандартной библиотеки сверх PRELOADED_MODULES.
+    resource.setrlimit(resource.RLIMIT_NOFILE, (RESULT_FD + 1, RESULT_FD + 1))
+    if os.getuid() == 0:
+        os.setgroups([])
+        os.setgid(NOBODY_UID)
+        os.setuid(NOBODY_UID)
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+
+def _execute(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Выполняется в недоверенном процессе: только собирает ответы решения.
+    Ожидаемые ответы сюда не передаются, сравнение — в процессе приложения.
+    """
+    namespace = {"__name__": "__sandbox__"}
+    try:
+        exec(compile(job["code"], "<submission>", "exec"), namespace)
+    except MemoryError:
+        return {"verdict": "memory_limit", "error": "Превышен лимит памяти"}
+    except BaseException as e:
+        # Текст исключения задаёт код решения, а он уходит пользователю.
+        return {"verdict": "error", "error": type(e).__name__}
+
+    function = namespace.get(job["entry_point"])
+    if not callable(function):
+        return {
+            "verdict": "error",
+            "error": f"Функция {job['entry_point']} не найдена",
+        }
+
+    outputs = []
+    for arguments in job["inputs"]:
+        try:
+            outputs.append({"output": normalize_value(function(*copy.deepcopy(arguments)))})
+        except BaseException as e:
+            outputs.append({"error": type(e).__name__})
+            if job["stop_on_error"]:
+                break
+    return {"verdict": "collected", "outputs": outputs}
+
+
+def _outcome(outputs: Any, index: int) -> Dict[str, Any]:
+    """Ответ на тест index из данных песочницы, которым нельзя доверять."""
+    outcome = outputs[index] if isinstance(outputs, list) and index < len(outputs) else None
+    if not isinstance(outcome, dict) or not ("output" in outcome or "error" in outcome):
+        return {"error": "NoResult"}
+    return outcome
+
+
+def compare_outputs(tests: List[Dict[str, Any]], outputs: Any) -> Dict[str, Any]:
+    for index, case in enumerate(tests):
+        outcome = _outcome(outputs, index)
+        if "output" not in outcome:
+            error = str(outcome["error"])[:100]
+            return {
+                "verdict": "memory_limit" if error == "MemoryError" else "failed",
+                "passed": index,
+                "total": len(tests),
+                "error": f"Тест {index + 1}: {error}",
+            }
+        if not values_match(outcome["output"], case["output"]):
+            return {
+                "verdict": "failed",
+                "passed": index,
+                "total": len(tests),
+                "error": f"Тест {index + 1}: неверный ответ",
+            }
+    return {"verdict": "passed", "passed": len(tests), "total": len(tests)}
+
+
+def _run_isolated(job: Dict[str, Any], cpu_limit: int, memory_limit: int, wall_limit: float):
+    """Выполняет задание в отдельном дочернем процессе с лимитами ресурсов."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # Код решения не должен видеть канал воркера к приложению.
+            write_fd = _isolate_result_fd(write_fd)
+            _apply_limits(cpu_limit, memory_limit)
+            result = _execute(job)
+        except BaseException as e:
+            result = {"verdict": "error", "error": f"{type(e).__name__}"}
+        try:
+            payload = json.dumps(result, default=repr).encode("utf-8")
+            while payload:
+                payload = payload[os.write(write_fd, payload):]
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    chunks, size, timed_out = [], 0, False
+    deadline = time.monotonic() + wall_limit
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            ready = select.select([read_fd], [], [], max(0, remaining))[0]
+            if not ready:
+                timed_out = True
+                break
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > SANDBOX_MAX_OUTPUT:
+                timed_out = True
+                break
+    finally:
+        os.close(read_fd)
+        if timed_out:
+            os.kill(pid, signal.SIGKILL)
+        _, status = os.waitpid(pid, 0)
+
+    if timed_out:
+        return {"verdict": "timeout", "error": "Превышено время выполнения"}
+    if os.WIFSIGNALED(status):
+        if os.WTERMSIG(status) in (signal.SIGXCPU, signal.SIGKILL):
+            return {"verdict": "timeout", "error": "Превышен лимит процессорного времени"}
+        return {"verdict": "error", "error": f"Процесс завершён сигналом {os.WTERMSIG(status)}"}
+    try:
+        result = json.loads(b"".join(chunks))
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        return {"verdict": "error", "error": "Некорректный ответ песочницы"}
+    return result
+
+
+def _read_exactly(fd: int, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def _worker_main(cpu_limit: int, memory_limit: int, wall_limit: float):
+    """
+    Цикл воркера: задания приходят в stdin, ответы уходят в stdout, каждое
+    сообщение — длина (4 байта) и JSON. Воркер запущен отдельным
+    интерпретатором (python -I -S, пустое окружение), поэтому модулей и
+    секретов приложения в его памяти нет.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for name in PRELOADED_MODULES:
+        importlib.import_module(name)
+    while True:
+        try:
+            size = int.from_bytes(_read_exactly(0, FRAME_HEADER), "big")
+            job = json.loads(_read_exactly(0, size))
+        except EOFError:
+            # Приложение завершилось или закрыло канал.
+            return
+        payload = json.dumps(_run_isolated(job, cpu_limit, memory_limit, wall_limit)).encode("utf-8")
+        payload = len(payload).to_bytes(FRAME_HEADER, "big") + payload
+        while payload:
+            payload = payload[os.write(1, payload):]
+
+
+class _Worker:
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+
+    async def request(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        payload = json.dumps(job).encode("utf-8")
+        self.process.stdin.write(len(payload).to_bytes(FRAME_HEADER, "big") + payload)
+        await self.process.stdin.drain()
+        size = int.from_bytes(await self.process.stdout.readexactly(FRAME_HEADER), "big")
+        return json.loads(await self.process.stdout.readexactly(size))
+
+    def kill(self):
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+class SandboxPool:
+    """
+    Пул заранее запущенных процессов для проверки решений тестами. Воркеры —
+    отдельные интерпретаторы (python -I -S) с пустым окружением: модулей,
+    памяти и секретов приложения у них нет. Каждый воркер на каждое решение
+    порождает fork-потомка с лимитами процессорного времени, памяти и времени
+    выполнения (RLIMIT_CPU, RLIMIT_AS, таймаут), без прав на запись файлов и
+    порождение процессов. Потомку оставлен только канал результата, а
+    RLIMIT_NOFILE не даёт открыть новые дескрипторы — ни сокеты, ни файлы.
+    Потомок получает только входные данные тестов и возвращает ответы в
+    JSON; сравнение с ожидаемыми ответами выполняется в процессе приложения.
+    Воркер, который не ответил вовремя, убивается и заменяется новым.
+
+    Это не контейнер: ядро и уже открытые дескрипторы остаются общими,
+    поэтому сетевой namespace или seccomp в окружении развёртывания не лишние.
+    """
+
+    def __init__(
+        self,
+        workers: int = SANDBOX_WORKERS,
+        cpu_limit: int = SANDBOX_CPU_LIMIT,
+        memory_limit_mb: int = SANDBOX_MEMORY_LIMIT_MB,
+        wall_limit: float = SANDBOX_WALL_LIMIT,
+    ):
+        self.workers = workers
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.wall_limit = wall_limit
+        self._idle: Optional[asyncio.Queue] = None
+        self._all: List[_Worker] = []
+        self._respawning = set()
+        self.respawns = 0
+
+    @property
+    def available(self) -> bool:
+        return self._idle is not None
+
+    async def start(self):
+        if resource is None or self.workers <= 0:
+            logger.warning("Sandbox pool disabled")
+            return
+        self._idle = asyncio.Queue()
+        try:
+            for _ in range(self.workers):
+                self._idle.put_nowait(await self._spawn())
+        except OSError:
+            logger.exception("Sandbox pool failed to start")
+            await self.stop()
+            return
+        logger.info(f"Sandbox pool started: {self.workers} workers")
+
+    async def stop(self):
+        for task in list(self._respawning):
+            task.cancel()
+        workers, self._all, self._idle = self._all, [], None
+        for worker in workers:
+            worker.kill()
+        await asyncio.gather(*(worker.process.wait() for worker in workers))
+
+    async def _spawn(self) -> _Worker:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-I",
+            "-S",
+            WORKER_SCRIPT,
+            str(self.cpu_limit),
+            str(self.memory_limit),
+            str(self.wall_limit),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env={},
+            cwd="/",
+            # Своя группа процессов: вместе с воркером убивается и его потомок.
+            start_new_session=True,
+        )
+        worker = _Worker(process)
+        self._all.append(worker)
+        return worker
+
+    async def _respawn(self):
+        try:
+            worker = await self._spawn()
+        except OSError:
+            logger.exception("Sandbox worker respawn failed")
+            return
+        if self._idle is None:
+            worker.kill()
+            return
+        self._idle.put_nowait(worker)
+
+    def _discard(self, worker: _Worker):
+        worker.kill()
+        if worker not in self._all:
+            return
+        self._all.remove(worker)
+        self.respawns += 1
+        logger.warning("Sandbox worker replaced")
+        task = asyncio.create_task(self._respawn())
+        self._respawning.add(task)
+        task.add_done_callback(self._respawning.discard)
+
+    async def _submit(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        if self._idle is None:
+            raise SandboxError("Sandbox pool is not running")
+        worker = await self._idle.get()
+        try:
+            result = await asyncio.wait_for(worker.request(job), self.wall_limit + 2)
+        except (asyncio.TimeoutError, EOFError, OSError, ValueError) as e:
+            self._discard(worker)
+            raise SandboxError(f"Sandbox worker failed: {type(e).__name__}")
+        except asyncio.CancelledError:
+            self._discard(worker)
+            raise
+        if self._idle is not None:
+            self._idle.put_nowait(worker)
+        return result
+
+    async def _collect(
+        self, code: str, entry_point: str, tests: List[Dict[str, Any]], stop_on_error: bool
+    ) -> Dict[str, Any]:
+        return await self._submit(
+            {
+                "code": code,
+                "entry_point": entry_point,
+                "inputs": [case["input"] for case in tests],
+                "stop_on_error": stop_on_error,
+            }
+        )
+
+    async def run(
+        self, code: str, entry_point: str, tests: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Прогоняет решение по тестам. verdict: passed, failed, error, timeout, memory_limit."""
+        started = time.perf_counter()
+        result = await self._collect(code, entry_point, tests, stop_on_error=True)
+        if result.get("verdict") == "collected":
+            result = compare_outputs(tests, result.get("outputs"))
+        elif result.get("verdict") in ("error", "timeout", "memory_limit"):
+            result = {"verdict": result["verdict"], "error": str(result.get("error"))[:500]}
+        else:
+            result = {"verdict": "error", "error": "Некорректный ответ песочницы"}
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def validate(
+        self, code: str, entry_point: str, tests: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Оставляет тесты, ожидаемый ответ которых совпал с ответом эталонного решения."""
+        result = await self._collect(code, entry_point, tests, stop_on_error=False)
+        if result.get("verdict") != "collected":
+            return []
+        validated = []
+        for index, case in enumerate(tests):
+            outcome = _outcome(result.get("outputs"), index)
+            if "output" in outcome and values_match(outcome["output"], case["output"]):
+                validated.append(case)
+        return validated
+
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]))
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "no-cache")
+DEV_MODE = os.getenv("DEV_MODE", "0") == "1"
+
+# Предпочтительный порядок кодировок при равных q.
+ENCODINGS = ("br", "gzip")
+
+
+class StaticAsset:
+    def __init__(self, path: str):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.load()
+
+    def load(self):
+        with open(self.path, "rb") as file:
+            body = file.read()
+        self.mtime = os.stat(self.path).st_mtime
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        self.bodies: Dict[str, bytes] = {"identity": body}
+        self.bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11)
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.bodies
+        }
+
+    def is_stale(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime != self.mtime
+        except FileNotFoundError:
+            return False
+
+
+def negotiate_encoding(accept_encoding: str, available) -> str:
+    """Выбирает кодировку по заголовку Accept-Encoding с учётом q-значений."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name.strip().lower()] = quality
+
+    best, best_quality = "identity", 0.0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class StaticAssets:
+    """
+    Статические файлы мини-приложения, загруженные в память и заранее
+    сжатые (gzip, а также brotli, если установлен). В режиме разработки
+    файлы перечитываются при изменении на диске.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR, dev_mode: bool = DEV_MODE):
+        self.directory = directory
+        self.dev_mode = dev_mode
+        self._assets: Dict[str, StaticAsset] = {}
+
+    def load(self):
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                self._assets[name] = StaticAsset(path)
+        logger.info(f"Loaded {len(self._assets)} static assets from {self.directory}")
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        asset = self._assets.get(name)
+        if asset is not None and self.dev_mode and asset.is_stale():
+            asset.load()
+            logger.info(f"Static asset reloaded: {name}")
+        return asset
+
+    def response(self, request: web.Request, name: str) -> web.Response:
+        asset = self.get(name)
+        if asset is None:
+            raise web.HTTPNotFound()
+
+        encoding = negotiate_encoding(
+            request.headers.get("Accept-Encoding", ""), asset.bodies
+        )
+        etag = asset.etags[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": STATIC_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request.headers.get("If-None-Match", "")
+        if if_none_match.strip() == "*" or etag in (
+            tag.strip() for tag in if_none_match.split(",")
+        ):
+            return web.Response(status=304, headers=headers)
+
+        return web.Response(
+            body=asset.bodies[encoding],
+            content_type=asset.content_type,
+            charset="utf-8" if asset.content_type.startswith("text/") else None,
+            headers=headers,
+        )
@@ -0,0 +1,185 @@
+import ast
+import os
+import textwrap
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from code_similarity import canonical_source
+from metrics import EVALUATION_GATES
+
+
+MAX_SUBMISSION_BYTES = int(os.getenv("MAX_SUBMISSION_BYTES", 20000))
+
+GATE_STAGES = ("size", "syntax", "forbidden", "template")
+
+# Чёрный список ниже — дешёвый предварительный фильтр очевидных попыток, а не
+# граница безопасности: sys, модули стандартной библиотеки и сборка имён
+# строками в getattr его обходят. Изолирует код решения только песочница
+# (sandbox.SandboxPool), и на этот фильтр она не рассчитывает.
+FORBIDDEN_MODULES = frozenset(
+    {
+        "builtins",
+        "ctypes",
+        "importlib",
+        "multiprocessing",
+        "os",
+        "pathlib",
+        "resource",
+        "shutil",
+        "signal",
+        "socket",
+        "subprocess",
+        "threading",
+    }
+)
+FORBIDDEN_CALLS = frozenset(
+    {"__import__", "breakpoint", "compile", "eval", "exec", "globals", "open", "vars"}
+)
+FORBIDDEN_ATTRIBUTES = frozenset(
+    {
+        "__bases__",
+        "__builtins__",
+        "__code__",
+        "__globals__",
+        "__mro__",
+        "__subclasses__",
+    }
+)
+
+# Имена, обращение к которым запрещено в любом виде, а не только вызов:
+# `f = __import__` или `__builtins__["eval"]` обходят проверку вызовов.
+FORBIDDEN_NAMES = frozenset({"__builtins__", "__import__", "breakpoint", "eval", "exec"})
+
+# Стадии, на которых проверка может закончиться до удалённых вызовов.
+SHORT_CIRCUIT_STAGES = GATE_STAGES + ("tests",)
+
+stats: Dict[str, int] = {
+    "checked": 0,
+    "remote": 0,
+    **{f"{stage}_rejected": 0 for stage in SHORT_CIRCUIT_STAGES},
+}
+
+
+def find_forbidden_construct(tree: ast.AST) -> Optional[str]:
+    """
+    Первая запрещённая конструкция в коде или None. Ловит только буквальные
+    обращения; отказ экономит запуск песочницы, пропуск ничего не разрешает.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""]
+        else:
+            modules = []
+        for module in modules:
+            if module.split(".")[0] in FORBIDDEN_MODULES:
+                return f"импорт модуля {module}"
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in FORBIDDEN_CALLS
+        ):
+            return f"вызов {node.func.id}()"
+        if isinstance(node, ast.Name) and node.id in FORBIDDEN_NAMES:
+            return f"обращение к {node.id}"
+        if isinstance(node, ast.Attribute) and node.attr in FORBIDDEN_ATTRIBUTES:
+            return f"обращение к {node.attr}"
+        # getattr(f, "__globals__") и подобные обращения по строке.
+        if isinstance(node, ast.Constant) and node.value in FORBIDDEN_ATTRIBUTES:
+            return f"обращение к {node.value}"
+    return None
+
+
+def _check_stage(
+    stage: str, code: str, template_code: Optional[str], state: Dict[str, Any]
+) -> Optional[str]:
+    """Причина отказа или None, если стадия пройдена."""
+    if stage == "size":
+        if not code or not code.strip():
+            return "Пустое решение."
+        if len(code.encode("utf-8")) > MAX_SUBMISSION_BYTES:
+            return f"Решение длиннее {MAX_SUBMISSION_BYTES} байт."
+        return None
+
+    if stage == "syntax":
+        try:
+            state["tree"] = ast.parse(textwrap.dedent(code))
+        except SyntaxError as e:
+            return f"Синтаксическая ошибка в строке {e.lineno}: {e.msg}."
+        except ValueError as e:
+            return f"Код не разбирается: {e}."
+        return None
+
+    if stage == "forbidden":
+        construct = find_forbidden_construct(state["tree"])
+        return f"Запрещённая конструкция: {construct}." if construct else None
+
+    if code.strip() == template_code.strip() or ast.unparse(
+        state["tree"]
+    ) == canonical_source(template_code):
+        return "Решение совпадает с эталонным."
+    return None
+
+
+def run_local_gates(
+    code: str, template_code: Optional[str], executed: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, str]]]:
+    """
+    Дешёвые локальные проверки до удалённых стадий: размер, синтаксис,
+    запрещённые конструкции, совпадение с эталоном. Запрещённые конструкции
+    ищутся, только если решение будет выполнено в песочнице (executed):
+    код, который оценивает только LLM, не запускается. Останавливается на
+    первом отказе. Возвращает журнал стадий и (стадия, причина) отказа.
+    """
+    stats["checked"] += 1
+    stages, state = [], {}
+    for stage in GATE_STAGES:
+        started = time.perf_counter()
+        if (stage == "template" and not template_code) or (
+            stage == "forbidden" and not executed
+        ):
+            status, reason = "skipped", None
+        else:
+            reason = _check_stage(stage, code, template_code, state)
+            status = "passed" if reason is None else "rejected"
+        stages.append(
+            {
+                "stage": stage,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+        )
+        EVALUATION_GATES.labels(stage, status).inc()
+        if status == "rejected":
+            stats[f"{stage}_rejected"] += 1
+            stages[-1]["reason"] = reason
+            return stages, (stage, reason)
+    return stages, None
+
+
+def record_tests_rejected():
+    stats["tests_rejected"] += 1
+
+
+def record_remote():
+    """Решение дошло до удалённых стадий (сходство, ревью LLM)."""
+    stats["remote"] += 1
+
+
+def gate_stats() -> Dict[str, Any]:
+    """Счётчики и доля решений, отсечённых до удалённых стадий, всего и по стадиям."""
+    checked = stats["checked"]
+
+    def rate(count):
+        return round(count / checked, 4) if checked else 0.0
+
+    return {
+        **stats,
+        "short_circuit_rate": rate(
+            sum(stats[f"{stage}_rejected"] for stage in SHORT_CIRCUIT_STAGES)
+        ),
+        "by_stage": {
+            stage: rate(stats[f"{stage}_rejected"]) for stage in SHORT_CIRCUIT_STAGES
+        },
+    }
@@ -0,0 +1,72 @@
+import logging
+import os
+import signal
+import time
+from typing import Callable, Dict
+
+
+logger = logging.getLogger(__name__)
+
+
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", 1))
+
+
+def run_workers(target: Callable[[int], None], workers: int):
+    """
+    Запускает workers дочерних процессов fork'ом и перезапускает упавшие.
+    Каждый воркер вызывает target(номер воркера); общий порт они делят
+    через SO_REUSEPORT. SIGTERM и SIGINT пересылаются воркерам, после
+    чего супервизор дожидается их завершения.
+    """
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                target(index)
+            except (SystemExit, KeyboardInterrupt):
+                # Повторный сигнал во время остановки.
+                pass
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        children[pid] = index
+        logger.info(f"Worker {index} started: pid {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(
+            f"Worker {index} (pid {pid}) exited with status {status}, restarting"
+        )
+        time.sleep(WORKER_RESTART_DELAY)
+        if not stopping:
+            spawn(index)
+    logger.info("All workers stopped")
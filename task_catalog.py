@@ -0,0 +1,44 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+CATALOG_CACHE_PAGES = int(os.getenv("CATALOG_CACHE_PAGES", 256))
+
+_pages: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+_version = 0
+
+
+def version() -> int:
+    """Текущая версия каталога. Меняется при каждой инвалидации."""
+    return _version
+
+
+def get_page(key: tuple) -> Optional[Tuple[bytes, str]]:
+    """Возвращает готовое JSON-тело страницы каталога и его ETag."""
+    page = _pages.get(key)
+    if page is not None:
+        _pages.move_to_end(key)
+    return page
+
+
+def put_page(key: tuple, body: bytes, seen_version: int) -> str:
+    """
+    Сохраняет закодированную страницу каталога. Если каталог успел
+    измениться, пока страница собиралась, она не кэшируется.
+    """
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    if seen_version == _version:
+        _pages[key] = (body, etag)
+        _pages.move_to_end(key)
+        while len(_pages) > CATALOG_CACHE_PAGES:
+            _pages.popitem(last=False)
+    return etag
+
+
+def invalidate():
+    """Сбрасывает кэш: добавлено задание или изменилось число решений."""
+    global _version
+    _version += 1
+    _pages.clear()
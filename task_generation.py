@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import task_catalog
+from fingerprint_store import store_template_fingerprint
+from models.task.task import Task
+
+
+logger = logging.getLogger(__name__)
+
+
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", 2))
+TASK_POOL_SIZE = int(os.getenv("TASK_POOL_SIZE", 2))
+TASK_POOL_TOPICS = int(os.getenv("TASK_POOL_TOPICS", 10))
+TASK_POOL_MIN_DEMAND = int(os.getenv("TASK_POOL_MIN_DEMAND", 2))
+TASK_POOL_REFILL_INTERVAL = float(os.getenv("TASK_POOL_REFILL_INTERVAL", 60))
+# Сколько разных тем отслеживается для спроса; редкие темы вытесняются.
+TASK_POOL_TRACKED_TOPICS = int(os.getenv("TASK_POOL_TRACKED_TOPICS", 1000))
+
+DIFFICULTIES = ("Легко", "Средне", "Сложно")
+
+PoolKey = Tuple[str, Optional[str]]
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+
+class TaskGenerator:
+    """
+    Сервис генерации заданий. Одинаковые одновременные запросы объединяются
+    в одну генерацию, для популярных тем в фоне поддерживается запас готовых
+    заданий, а число одновременных обращений к LLM ограничено.
+    Готовые задания из запаса сохраняются в БД только в момент выдачи.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        concurrency: int = GENERATION_CONCURRENCY,
+        pool_size: int = TASK_POOL_SIZE,
+        pool_topics: int = TASK_POOL_TOPICS,
+        refill_interval: float = TASK_POOL_REFILL_INTERVAL,
+        tracked_topics: int = TASK_POOL_TRACKED_TOPICS,
+        sandbox=None,
+        event_bus=None,
+    ):
+        self.session_factory = session_factory
+        self.sandbox = sandbox
+        self.event_bus = event_bus
+        self.pool_size = pool_size
+        self.pool_topics = pool_topics
+        self.refill_interval = refill_interval
+        self.tracked_topics = max(tracked_topics, pool_topics, 1)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: Dict[PoolKey, asyncio.Future] = {}
+        self._pool: Dict[PoolKey, Deque[Task]] = {}
+        self._topics: Dict[PoolKey, Tuple[str, Optional[str]]] = {}
+        self._demand: Counter = Counter()
+        self._refill_wakeup = asyncio.Event()
+        self._refill_task = None
+
+    async def start(self):
+        if self.pool_size > 0:
+            self._refill_task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self):
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+            self._refill_task = None
+
+    async def get_task(self, topic: str, difficulty: Optional[str] = None) -> Task:
+        """Возвращает новое сохранённое задание по теме."""
+        if difficulty not in DIFFICULTIES:
+            difficulty = None
+        key = (normalize_topic(topic), difficulty)
+        if key not in self._demand and len(self._demand) >= self.tracked_topics:
+            self._forget_rare_topics()
+        self._topics.setdefault(key, (topic, difficulty))
+        self._demand[key] += 1
+
+        pool = self._pool.get(key)
+        if pool:
+            task = pool.popleft()
+            self._refill_wakeup.set()
+            return await self._persist(task)
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._generate_and_persist(topic, difficulty))
+            self._inflight[key] = flight
+            flight.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(flight)
+
+    async def _generate(self, topic: str, difficulty: Optional[str]) -> Task:
+        async with self._semaphore:
+            return await Task.generate_task_from_topic(
+                topic, difficulty, sandbox=self.sandbox
+            )
+
+    async def _generate_and_persist(self, topic: str, difficulty: Optional[str]) -> Task:
+        return await self._persist(await self._generate(topic, difficulty))
+
+    async def _persist(self, task: Task) -> Task:
+        async with self.session_factory() as session:
+            session.add(task)
+            if task.inference:
+                await store_template_fingerprint(session, task.inference)
+            if self.event_bus is not None:
+                # Каталог других воркеров сбрасывается после commit.
+                await self.event_bus.publish(session, "catalog", {})
+            await session.commit()
+        task_catalog.invalidate()
+        return task
+
+    def _forget_rare_topics(self):
+        """Оставляет самую востребованную половину отслеживаемых тем."""
+        kept = dict(self._demand.most_common(self.tracked_topics // 2))
+        for key in list(self._demand):
+            if key not in kept:
+                del self._demand[key]
+                self._topics.pop(key, None)
+
+    async def _refill_loop(self):
+        # Спрос затухает по расписанию: выдачи из запаса будят цикл постоянно,
+        # и таймаут ожидания при нагрузке не наступает.
+        next_decay = time.monotonic() + self.refill_interval
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._refill_wakeup.wait(), max(0, next_decay - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._refill_wakeup.clear()
+            decay = time.monotonic() >= next_decay
+            if decay:
+                next_decay = time.monotonic() + self.refill_interval
+            try:
+                await self._refill(decay)
+            except Exception as e:
+                logger.error(f"Task pool refill failed: {e}", exc_info=True)
+
+    async def _refill(self, decay: bool):
+        hot_topics = [
+            key
+            for key, demand in self._demand.most_common(self.pool_topics)
+            if demand >= TASK_POOL_MIN_DEMAND
+        ]
+        for key in list(self._pool):
+            if key not in self._demand:
+                del self._pool[key]
+
+        for key in hot_topics:
+            pool = self._pool.setdefault(key, deque())
+            topic, difficulty = self._topics[key]
+            while len(pool) < self.pool_size:
+                pool.append(await self._generate(topic, difficulty))
+                logger.info(f"Task pool for '{topic}': {len(pool)} ready")
+
+        if not decay:
+            return
+        for key in list(self._demand):
+            self._demand[key] //= 2
+            if not self._demand[key]:
+                del self._demand[key]
+                self._topics.pop(key, None)
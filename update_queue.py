@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable, List
+
+from aiogram import types
+
+
+logger = logging.getLogger(__name__)
+
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", 10000))
+UPDATE_DRAIN_TIMEOUT = float(os.getenv("UPDATE_DRAIN_TIMEOUT", 8))
+
+
+class UpdateQueueFullError(Exception):
+    """Очередь входящих обновлений переполнена."""
+
+
+def ordering_key(update: types.Update) -> int:
+    """Ключ упорядочивания: чат, иначе пользователь, иначе само обновление."""
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(
+        getattr(event, "message", None), "chat", None
+    )
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+class UpdateQueue:
+    """
+    Очередь входящих обновлений Telegram. Обновления одного чата всегда
+    попадают к одному воркеру и обрабатываются по порядку; повторные
+    обновления с тем же update_id в пределах окна отбрасываются.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[types.Update], Awaitable[None]],
+        workers: int = UPDATE_WORKERS,
+        max_size: int = UPDATE_QUEUE_SIZE,
+        dedup_window: int = UPDATE_DEDUP_WINDOW,
+        drain_timeout: float = UPDATE_DRAIN_TIMEOUT,
+    ):
+        self.process = process
+        self.workers = workers
+        self.max_size = max_size
+        self.drain_timeout = drain_timeout
+        self._accepting = False
+        self._recent_ids = deque(maxlen=dedup_window)
+        self._recent_set = set()
+        self._queues: List[asyncio.Queue] = []
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def start(self):
+        shard_size = max(1, self.max_size // self.workers)
+        self._queues = [asyncio.Queue(maxsize=shard_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue)) for queue in self._queues
+        ]
+        self._accepting = True
+
+    async def stop(self):
+        """
+        Перестаёт принимать обновления и ждёт, пока воркеры разберут уже
+        принятые (на них вебхук ответил 200, Telegram их не повторит), но не
+        дольше drain_timeout; затем останавливает воркеры.
+        """
+        self._accepting = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                self.drain_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue drain timed out, {self.depth} updates dropped")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def is_duplicate(self, update_id: int) -> bool:
+        return update_id in self._recent_set
+
+    def _remember(self, update_id: int):
+        if len(self._recent_ids) == self._recent_ids.maxlen:
+            self._recent_set.discard(self._recent_ids[0])
+        self._recent_ids.append(update_id)
+        self._recent_set.add(update_id)
+
+    def put(self, update: types.Update) -> bool:
+        """
+        Ставит обновление в очередь. Возвращает False для дубликата,
+        бросает UpdateQueueFullError, если очередь чата заполнена или
+        остановлена.
+        """
+        if self.is_duplicate(update.update_id):
+            return False
+        if not self._accepting:
+            raise UpdateQueueFullError("Update queue is stopped")
+        queue = self._queues[ordering_key(update) % self.workers]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            raise UpdateQueueFullError("Update queue is full")
+        self._remember(update.update_id)
+        return True
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.process(update)
+            except Exception as e:
+                logger.error(
+                    f"Update {update.update_id} processing failed: {e}", exc_info=True
+                )
+            finally:
+                queue.task_done()
@@ -0,0 +1,81 @@
+import logging
+import os
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+logger = logging.getLogger(__name__)
+
+
+USER_STATS_RECONCILE_INTERVAL = float(os.getenv("USER_STATS_RECONCILE_INTERVAL", 3600))
+
+# Пересчитывает агрегаты пользователей по user_tasks и исправляет только
+# разошедшиеся строки. Возвращает исправленных пользователей. expected взят
+# из снимка запроса; если record_completion успел изменить строку, UPDATE
+# перепроверяет условие на новой версии и пропускает её по seen_*, чтобы не
+# затереть свежие очки устаревшими, — строку поправит следующая сверка.
+RECONCILE_USER_STATS = text(
+    """
+    WITH per_difficulty AS (
+        SELECT user_tasks.user_id,
+               tasks.difficulty,
+               count(*) AS solved,
+               sum(user_tasks.earned_points) AS points,
+               max(user_tasks.completed_at) AS last_solved_at
+        FROM user_tasks
+        JOIN tasks ON tasks.id = user_tasks.task_id
+        GROUP BY user_tasks.user_id, tasks.difficulty
+    ),
+    totals AS (
+        SELECT user_id,
+               sum(solved)::int AS solved_count,
+               sum(points)::int AS points,
+               max(last_solved_at) AS last_solved_at,
+               coalesce(
+                   jsonb_object_agg(difficulty, solved)
+                       FILTER (WHERE difficulty IS NOT NULL),
+                   '{}'::jsonb
+               ) AS solved_by_difficulty
+        FROM per_difficulty
+        GROUP BY user_id
+    ),
+    expected AS (
+        SELECT users.id,
+               users.points AS seen_points,
+               users.solved_count AS seen_solved_count,
+               coalesce(totals.solved_count, 0) AS solved_count,
+               coalesce(totals.points, 0) AS points,
+               totals.last_solved_at,
+               coalesce(totals.solved_by_difficulty, '{}'::jsonb) AS solved_by_difficulty
+        FROM users
+        LEFT JOIN totals ON totals.user_id = users.id
+    )
+    UPDATE users
+    SET solved_count = expected.solved_count,
+        points = expected.points,
+        last_solved_at = expected.last_solved_at,
+        solved_by_difficulty = expected.solved_by_difficulty
+    FROM expected
+    WHERE users.id = expected.id
+      AND users.points = expected.seen_points
+      AND users.solved_count = expected.seen_solved_count
+      AND (users.solved_count, users.points, users.last_solved_at, users.solved_by_difficulty)
+          IS DISTINCT FROM
+          (expected.solved_count, expected.points, expected.last_solved_at,
+           expected.solved_by_difficulty)
+    RETURNING users.id, users.username, users.points
+    """
+)
+
+
+async def reconcile_user_stats(session: AsyncSession) -> List:
+    """
+    Сверяет денормализованную статистику пользователей с user_tasks и
+    исправляет расхождения. Только PostgreSQL; коммит остаётся за вызывающим.
+    """
+    rows = (await session.execute(RECONCILE_USER_STATS)).all()
+    if rows:
+        logger.warning(f"User stats reconciled for {len(rows)} users")
+    return rows
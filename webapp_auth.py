@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.utils.web_app import safe_parse_webapp_init_data
+from aiohttp import web
+
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+SESSION_TTL = int(os.getenv("SESSION_TTL", 12 * 3600))
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", 10000))
+INIT_DATA_CACHE_TTL = float(os.getenv("INIT_DATA_CACHE_TTL", 3600))
+
+_SECRET = hmac.new(b"session", (BOT_TOKEN or "").encode("utf-8"), hashlib.sha256).digest()
+
+_verified: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(_SECRET, payload.encode("utf-8"), hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def issue_token(user_id: int) -> str:
+    """Выдаёт подписанный токен сессии вида '<user_id>.<expires>.<подпись>'."""
+    payload = f"{user_id}.{int(time.time()) + SESSION_TTL}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token: str) -> Optional[int]:
+    try:
+        user_id, expires, signature = token.split(".")
+        payload = f"{user_id}.{expires}"
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        if int(expires) < time.time():
+            return None
+        return int(user_id)
+    except (ValueError, AttributeError):
+        return None
+
+
+def verify_init_data(init_data: str) -> Optional[int]:
+    """
+    Проверяет initData Telegram и возвращает id пользователя. Недавно
+    проверенные initData запоминаются по хешу, чтобы не проверять их повторно.
+    """
+    if not init_data:
+        return None
+
+    key = hashlib.sha256(init_data.encode("utf-8")).digest()
+    entry = _verified.get(key)
+    if entry is not None:
+        user_id, expires_at = entry
+        if expires_at > time.monotonic():
+            _verified.move_to_end(key)
+            return user_id
+        del _verified[key]
+
+    try:
+        webapp_data = safe_parse_webapp_init_data(BOT_TOKEN, init_data=init_data)
+    except ValueError:
+        return None
+    if webapp_data.user is None:
+        return None
+
+    _verified[key] = (webapp_data.user.id, time.monotonic() + INIT_DATA_CACHE_TTL)
+    while len(_verified) > INIT_DATA_CACHE_SIZE:
+        _verified.popitem(last=False)
+    return webapp_data.user.id
+
+
+def authenticate_request(request: web.Request, data: Dict[str, Any]) -> Optional[int]:
+    """
+    Определяет пользователя запроса: по токену сессии из заголовка
+    Authorization: Bearer или поля token, иначе по initData.
+    """
+    header = request.headers.get("Authorization", "")
+    token = header[7:] if header.startswith("Bearer ") else data.get("token")
+    if token:
+        return verify_token(token)
+    return verify_init_data(data.get("initData"))